@@ -1,25 +1,58 @@
-from src.logger import chatbot_logger, message_logger
+from src import config
+from src.logger import chatbot_logger, message_logger, query_logger
+from src.Course import set_directories
 from src.discord.DiscordBot import DiscordBot
+from src.discord.QueryScheduler import QueryScheduler
+from src.discord.SessionStore import SessionStore
+from src.metrics import start_metrics_logger, start_metrics_server
+from src.worker.RemoteChatBot import RemoteChatBot
 import os
 
 
 chatbot_logger = chatbot_logger(logLevel=10)
 message_logger = message_logger(logLevel=10)
+query_logger = query_logger(logLevel=20)
 
 # environment variables
 BOT_TOKEN = os.environ.get('DISCORD_BOT_TOKEN')
-DOCUMENTS_DIR = os.environ.get('DOCUMENTS_DIR')
-INDEX_DIR = os.environ.get('INDEX_DIR')
+QUERY_CONCURRENCY = int(os.environ.get('QUERY_CONCURRENCY', 1))
+QUERY_QUEUE_SIZE = int(os.environ.get('QUERY_QUEUE_SIZE', 20))
+QUERY_USER_LIMIT = int(os.environ.get('QUERY_USER_LIMIT', 2))
+STREAM_RESPONSES = os.environ.get('STREAM_RESPONSES', 'false').lower() == 'true'
+SESSION_DB = os.environ.get('SESSION_DB')
+WORKER_URLS = [url for url in os.environ.get('WORKER_URLS', '').split(',') if url]
+WORKER_TIMEOUT = float(os.environ.get('WORKER_TIMEOUT', 360))
+WORKER_HEALTH_INTERVAL = float(os.environ.get('WORKER_HEALTH_INTERVAL', 10))
 
 if not BOT_TOKEN:
     chatbot_logger.error('DISCORD_BOT_TOKEN environment variable not set')
     exit(1)
 
-if not DOCUMENTS_DIR:
-    DOCUMENTS_DIR = './data/documents'
+if config.METRICS_PORT:
+    start_metrics_server(int(config.METRICS_PORT))
 
-if not INDEX_DIR:
-    INDEX_DIR = './data/index'
+if config.METRICS_LOG_INTERVAL > 0:
+    start_metrics_logger(config.METRICS_LOG_INTERVAL)
 
-client = DiscordBot(documents_dir=DOCUMENTS_DIR, index_dir=INDEX_DIR)
+if WORKER_URLS:
+    # the questions are answered by worker processes (Worker_main.py), only the courses are needed here
+    set_directories(config.DOCUMENTS_DIR, config.INDEX_DIR)
+    chatbot = RemoteChatBot(WORKER_URLS, timeout=WORKER_TIMEOUT, health_interval=WORKER_HEALTH_INTERVAL)
+    chatbot.start_health_checks()
+else:
+    chatbot = config.create_chatbot()
+
+    if config.WARM_UP:
+        chatbot.warmer.warm_up()
+
+    if config.KEEP_WARM_INTERVAL > 0:
+        chatbot.warmer.start()
+
+    if config.WATCH_INTERVAL > 0:
+        chatbot.watcher.start()
+
+scheduler = QueryScheduler(max_concurrency=QUERY_CONCURRENCY, max_queue_size=QUERY_QUEUE_SIZE,
+                           max_pending_per_user=QUERY_USER_LIMIT)
+
+client = DiscordBot(chatbot, scheduler, stream_responses=STREAM_RESPONSES, sessions=SessionStore(SESSION_DB))
 client.run(BOT_TOKEN)
@@ -0,0 +1,41 @@
+from llama_index.core.llms import MockLLM
+
+from src import config
+from src.logger import chatbot_logger, message_logger, query_logger
+from src.metrics import start_metrics_logger, start_metrics_server
+from src.worker.WorkerServer import WorkerServer
+import os
+
+# environment variables of the worker, the ChatBot is configured like in Bot_main.py
+WORKER_HOST = os.environ.get('WORKER_HOST', '127.0.0.1')
+WORKER_PORT = int(os.environ.get('WORKER_PORT', 8101))
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 1))
+STUB_LLM = os.environ.get('STUB_LLM', 'false').lower() == 'true'
+
+# every worker logs to files of its own
+LOG_DIR = f"temp/worker-{WORKER_PORT}"
+chatbot_logger = chatbot_logger(logLevel=10, file=f"{LOG_DIR}/chatbot.log")
+message_logger = message_logger(logLevel=10, file=f"{LOG_DIR}/messages.log")
+query_logger = query_logger(logLevel=20, file=f"{LOG_DIR}/queries.jsonl")
+
+if config.METRICS_PORT:
+    start_metrics_server(int(config.METRICS_PORT))
+
+if config.METRICS_LOG_INTERVAL > 0:
+    start_metrics_logger(config.METRICS_LOG_INTERVAL)
+
+# a stand-in for Ollama to test the front-end and the workers without GPU
+chatbot = config.create_chatbot(llm=MockLLM(max_tokens=64) if STUB_LLM else None)
+
+if config.WARM_UP:
+    chatbot.warmer.warm_up()
+
+if config.KEEP_WARM_INTERVAL > 0:
+    chatbot.warmer.start()
+
+if config.WATCH_INTERVAL > 0:
+    chatbot.watcher.start()
+
+server = WorkerServer(chatbot, host=WORKER_HOST, port=WORKER_PORT, concurrency=WORKER_CONCURRENCY)
+chatbot_logger.info(f"Worker listening on http://{WORKER_HOST}:{WORKER_PORT}")
+server.serve_forever()
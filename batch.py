@@ -0,0 +1,53 @@
+import argparse
+import logging
+import warnings
+
+from llama_index.core.llms import MockLLM
+
+from src import config
+from src.ChatBot import QUERY_MODES, Course
+from src.helpers.Benchmark import percentile
+from src.helpers.BatchAnswering import load_batch, run_batch
+from src.logger import chatbot_logger, message_logger, query_logger
+
+warnings.filterwarnings(
+    "ignore", message=".*Torch was not compiled with flash attention.*")
+
+
+if __name__ == "__main__":
+    # Answer a file of questions, configured by the same environment variables as the bot, e.g.
+    # python batch.py questions.jsonl --output temp/answers.jsonl --parallel 4
+    # python batch.py temp/unanswered_questions.log --course it --output temp/recheck.jsonl
+    parser = argparse.ArgumentParser(description="Answer the questions of a JSONL file")
+    parser.add_argument("questions",
+                        help="JSONL file with question and course per line, or the unanswered questions log")
+    parser.add_argument("--output", required=True, help="JSONL file for the answers, existing answers are skipped")
+    parser.add_argument("--course", default=None, help="course of questions without a course")
+    parser.add_argument("--parallel", type=int, default=1, help="questions answered at the same time")
+    parser.add_argument("--batch-size", type=int, default=32, help="questions embedded together")
+    parser.add_argument("--mode", default=None, choices=QUERY_MODES, help="defaults to QUERY_MODE")
+    parser.add_argument("--stub-llm", action="store_true", help="answer with a local stand-in LLM instead of Ollama")
+    args = parser.parse_args()
+
+    # Loggers
+    chatbot_logger = chatbot_logger(logLevel=20)
+    message_logger = message_logger(logLevel=30)
+    # unanswered questions are marked in the output, the unanswered questions log may be the input of this run
+    logging.getLogger('UnansweredQuestions').disabled = True
+    query_logger = query_logger(logLevel=30)
+
+    items = load_batch(args.questions, default_course=args.course)
+    chat_bot = config.create_chatbot(llm=MockLLM(max_tokens=64) if args.stub_llm else None)
+    stats = run_batch(chat_bot, Course, items, args.output, parallelism=args.parallel, batch_size=args.batch_size,
+                      mode=args.mode)
+
+    latencies = stats["latencies"]
+    finished = len(latencies) + stats["errors"]
+    print(f"answered    {stats['answered']}")
+    print(f"unanswered  {stats['unanswered']}")
+    print(f"errors      {stats['errors']}")
+    if latencies:
+        print(f"latency     p50 {percentile(latencies, 50):.2f}s, p95 {percentile(latencies, 95):.2f}s, "
+              f"max {max(latencies):.2f}s")
+        print(f"throughput  {finished / stats['seconds']:.2f} questions/s")
+    print(f"answers written to {args.output}")
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import time
+import warnings
+
+from llama_index.core.llms import MockLLM
+
+from src.ChatBot import QUERY_MODES, RETRIEVAL_MODES, ChatBot, Course
+from src.helpers.Benchmark import load_questions, run_benchmark
+from src.logger import (chatbot_logger, message_logger,
+                        unanswered_questions_logger)
+
+warnings.filterwarnings(
+    "ignore", message=".*Torch was not compiled with flash attention.*")
+
+
+if __name__ == "__main__":
+    # Offline retrieval benchmark, e.g.
+    # python benchmark.py questions.jsonl --k 1 3 5 10 --full --stub-llm
+    parser = argparse.ArgumentParser(description="Measure retrieval quality and latency per query stage")
+    parser.add_argument("questions", help="JSONL file with question, course and expected sources per line")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10], help="cutoffs for recall@k")
+    parser.add_argument("--full", action="store_true", help="also run synthesis and the complete query")
+    parser.add_argument("--stub-llm", action="store_true", help="answer with a local stand-in LLM instead of Ollama")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    parser.add_argument("--documents-dir", default="./data/documents")
+    parser.add_argument("--index-dir", default="./data/index")
+    parser.add_argument("--vector-dtype", default="float32")
+    parser.add_argument("--query-mode", default="agent", choices=QUERY_MODES)
+    parser.add_argument("--retrieval-mode", default="hybrid", choices=RETRIEVAL_MODES)
+    parser.add_argument("--context-token-budget", type=int, default=1500,
+                        help="tokens of the packed context, 0 for no limit")
+    parser.add_argument("--no-context-packing", action="store_true",
+                        help="pass the retrieved nodes to the LLM unchanged")
+    args = parser.parse_args()
+
+    # Loggers
+    chatbot_logger = chatbot_logger(logLevel=20)
+    message_logger = message_logger(logLevel=30)
+    unanswered_questions_logger = unanswered_questions_logger(logLevel=30)
+
+    chat_bot = ChatBot(documents_dir=args.documents_dir, index_dir=args.index_dir, vector_dtype=args.vector_dtype,
+                       answer_cache_size=0, query_mode=args.query_mode,
+                       retrieval_mode=args.retrieval_mode, llm=MockLLM(max_tokens=64) if args.stub_llm else None,
+                       context_packing=not args.no_context_packing, context_token_budget=args.context_token_budget)
+
+    benchmark = run_benchmark(chat_bot, Course, load_questions(args.questions), sorted(args.k), full=args.full)
+    benchmark["config"] = {
+        "questions": args.questions,
+        "index_dir": args.index_dir,
+        "vector_dtype": args.vector_dtype,
+        "query_mode": chat_bot.query_mode,
+        "retrieval_mode": chat_bot.retrieval_mode,
+        "context_packing": chat_bot.context_packer is not None,
+        "context_token_budget": args.context_token_budget,
+        "stub_llm": args.stub_llm,
+        "k": sorted(args.k),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    output = args.output or f"temp/benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(benchmark, output_file, indent=2, ensure_ascii=False)
+
+    summary = benchmark["summary"]
+    for key, value in summary.items():
+        if key != "latency":
+            print(f"{key:12} {value:.3f}")
+    print(f"{'stage':12} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, latency in summary.get("latency", {}).items():
+        print(f"{stage:12} {latency['p50'] * 1000:7.1f}ms {latency['p95'] * 1000:7.1f}ms {latency['p99'] * 1000:7.1f}ms")
+    print(f"results written to {output}")
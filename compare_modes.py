@@ -0,0 +1,80 @@
+import argparse
+import json
+import statistics
+import time
+import warnings
+
+from src.ChatBot import QUERY_MODES, ChatBot, Course
+from src.helpers.Benchmark import percentile
+from src.logger import (chatbot_logger, message_logger,
+                        unanswered_questions_logger)
+
+warnings.filterwarnings(
+    "ignore", message=".*Torch was not compiled with flash attention.*")
+
+
+def source_links(result) -> set:
+    return {node.metadata.get("source_link") for node in result.source_nodes if node.metadata.get("source_link")}
+
+
+if __name__ == "__main__":
+    # Compare latency and answers of the agent and the direct query mode side by side.
+    # Each line of the questions file is a JSON object like {"question": "...", "course": "it"}
+    parser = argparse.ArgumentParser(description="Compare the agent and the direct query mode")
+    parser.add_argument("questions", help="JSONL file with question and course per line")
+    parser.add_argument("--output", default="temp/mode_comparison.jsonl", help="JSONL file for the results")
+    parser.add_argument("--documents-dir", default="./data/documents")
+    parser.add_argument("--index-dir", default="./data/index")
+    args = parser.parse_args()
+
+    # Loggers
+    chatbot_logger = chatbot_logger(logLevel=20)
+    message_logger = message_logger(logLevel=20)
+    unanswered_questions_logger = unanswered_questions_logger(logLevel=30)
+
+    # the answer cache would hide the latency of the second mode
+    chat_bot = ChatBot(documents_dir=args.documents_dir, index_dir=args.index_dir, answer_cache_size=0)
+
+    latencies = {mode: [] for mode in QUERY_MODES}
+    answered = {mode: 0 for mode in QUERY_MODES}
+    overlaps = []
+    with open(args.questions, encoding="utf-8") as questions_file, \
+            open(args.output, "w", encoding="utf-8") as output_file:
+        for line in questions_file:
+            if not line.strip():
+                continue
+            question = json.loads(line)
+            course = Course(question["course"].lower())
+            row = {"question": question["question"], "course": course.value}
+
+            for mode in QUERY_MODES:
+                start = time.perf_counter()
+                result = chat_bot.answer(question["question"], course, mode=mode)
+                latency = time.perf_counter() - start
+                latencies[mode].append(latency)
+                answered[mode] += result.answered
+                row[mode] = {
+                    "latency": round(latency, 3),
+                    "answered": result.answered,
+                    "answer": result.answer,
+                    "sources": sorted(source_links(result)),
+                }
+
+            agent_sources, direct_sources = set(row["agent"]["sources"]), set(row["direct"]["sources"])
+            union = agent_sources | direct_sources
+            row["source_overlap"] = len(agent_sources & direct_sources) / len(union) if union else 1.0
+            overlaps.append(row["source_overlap"])
+
+            output_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            print(f"{question['question'][:60]:60} agent {row['agent']['latency']:7.2f}s "
+                  f"direct {row['direct']['latency']:7.2f}s overlap {row['source_overlap']:.2f}")
+
+    if overlaps:
+        print()
+        for mode in QUERY_MODES:
+            print(f"{mode:6}: mean {statistics.mean(latencies[mode]):.2f}s, "
+                  f"median {statistics.median(latencies[mode]):.2f}s, "
+                  f"p95 {percentile(latencies[mode], 95):.2f}s, "
+                  f"answered {answered[mode]}/{len(overlaps)}")
+        print(f"mean source overlap: {statistics.mean(overlaps):.2f}")
+        print(f"answers written to {args.output}")
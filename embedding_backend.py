@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from src.helpers.Benchmark import load_questions, percentile
+from src.helpers.EmbeddingBackend import (EMBED_BACKENDS, create_embed_model,
+                                          export_onnx_model)
+from src.helpers.IndexVersions import current_dir
+from src.logger import chatbot_logger
+
+warnings.filterwarnings(
+    "ignore", message=".*Torch was not compiled with flash attention.*")
+
+
+def load_chunks(index_dir: str, courses, max_chunks: int) -> list:
+    """Texts of the indexed chunks of the given courses, as they are embedded"""
+    texts = []
+    for course in sorted(courses):
+        docstore = SimpleDocumentStore.from_persist_dir(current_dir(os.path.join(index_dir, course)))
+        texts.extend(node.get_content(metadata_mode=MetadataMode.EMBED) for node in docstore.docs.values())
+    return texts[:max_chunks]
+
+
+def embed(model, texts: list) -> np.ndarray:
+    return np.asarray(model.get_text_embedding_batch(texts), dtype=np.float32)
+
+
+def compare(args) -> int:
+    """
+    Check that the onnx backend retrieves the same chunks as the torch backend
+    :return: exit code, 1 if the mean overlap of the top k is below the tolerance
+    """
+    entries = load_questions(args.questions)
+    questions = [entry["question"] for entry in entries]
+    texts = load_chunks(args.index_dir, {entry["course"] for entry in entries}, args.max_chunks)
+
+    results = {}
+    for backend in EMBED_BACKENDS:
+        model = create_embed_model(backend, onnx_model_path=args.onnx_model_path, threads=args.threads)
+        results[backend] = (embed(model, texts), np.asarray([model.get_query_embedding(q) for q in questions]))
+
+    (torch_chunks, torch_queries), (onnx_chunks, onnx_queries) = results["torch"], results["onnx"]
+    k = min(args.k, len(texts))
+    torch_top = np.argsort(-(torch_queries @ torch_chunks.T), axis=1)[:, :k]
+    onnx_top = np.argsort(-(onnx_queries @ onnx_chunks.T), axis=1)[:, :k]
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(torch_top, onnx_top)]
+    top1 = np.mean(torch_top[:, 0] == onnx_top[:, 0])
+    similarity = np.sum(torch_chunks * onnx_chunks, axis=1)
+
+    print(f"chunks {len(texts)}, questions {len(questions)}")
+    print(f"cosine torch/onnx   mean {similarity.mean():.4f} min {similarity.min():.4f}")
+    print(f"top-1 agreement     {top1:.3f}")
+    print(f"overlap@{k}           mean {np.mean(overlaps):.3f} min {np.min(overlaps):.3f}")
+    if np.mean(overlaps) < args.tolerance:
+        print(f"FAILED: mean overlap@{k} below tolerance {args.tolerance}")
+        return 1
+    print("OK")
+    return 0
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB, None where it is not available (resource is Unix only)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def measure(args):
+    """Load one backend and time it, runs in its own process so that the memory of the backends does not add up"""
+    start = time.perf_counter()
+    model = create_embed_model(args.backend, onnx_model_path=args.onnx_model_path, threads=args.threads)
+    load_seconds = time.perf_counter() - start
+
+    entries = load_questions(args.questions)
+    questions = [entry["question"] for entry in entries]
+    model.get_query_embedding(questions[0])
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        model.get_query_embedding(question)
+        latencies.append(time.perf_counter() - start)
+
+    texts = load_chunks(args.index_dir, {entry["course"] for entry in entries}, args.max_chunks)
+    start = time.perf_counter()
+    embed(model, texts)
+    chunk_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "backend": args.backend,
+        "load_seconds": load_seconds,
+        "query_p50": percentile(latencies, 50),
+        "query_p95": percentile(latencies, 95),
+        "chunks_per_second": len(texts) / chunk_seconds if chunk_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def benchmark(args):
+    """Compare latency and memory of both backends, each measured in a fresh process"""
+    results = []
+    for backend in EMBED_BACKENDS:
+        command = [sys.executable, __file__, "measure", args.questions, "--backend", backend,
+                   "--index-dir", args.index_dir, "--max-chunks", str(args.max_chunks)]
+        if args.onnx_model_path:
+            command += ["--onnx-model-path", args.onnx_model_path]
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'backend':8} {'load s':>8} {'query p50 ms':>13} {'query p95 ms':>13} {'chunks/s':>9} {'peak RSS MB':>12}")
+    for result in results:
+        peak = "-" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.0f}"
+        print(f"{result['backend']:8} {result['load_seconds']:8.1f} {result['query_p50'] * 1000:13.1f} "
+              f"{result['query_p95'] * 1000:13.1f} {result['chunks_per_second']:9.1f} {peak:>12}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    # Embedding backends, e.g.
+    # python embedding_backend.py export ./data/models/bge-m3-int8
+    # python embedding_backend.py compare questions.jsonl --onnx-model-path ./data/models/bge-m3-int8
+    # python embedding_backend.py benchmark questions.jsonl --onnx-model-path ./data/models/bge-m3-int8 --threads 4
+    parser = argparse.ArgumentParser(description="Export, check and benchmark the ONNX embedding backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export BGE-M3 to ONNX and quantize it to int8")
+    export_parser.add_argument("output_dir")
+
+    for name, help_text in (("compare", "check that both backends rank the chunks alike"),
+                            ("benchmark", "compare latency and memory of both backends"),
+                            ("measure", "measure one backend, used by benchmark")):
+        command_parser = commands.add_parser(name, help=help_text)
+        command_parser.add_argument("questions", help="JSONL file with question and course per line")
+        command_parser.add_argument("--onnx-model-path", default=os.environ.get("ONNX_MODEL_PATH"))
+        command_parser.add_argument("--index-dir", default="./data/index")
+        command_parser.add_argument("--threads", type=int, default=None, help="CPU threads per embedding call")
+        command_parser.add_argument("--max-chunks", type=int, default=2000, help="indexed chunks to embed at most")
+        if name == "compare":
+            command_parser.add_argument("--k", type=int, default=5)
+            command_parser.add_argument("--tolerance", type=float, default=0.9, help="minimal mean overlap of the top k")
+        if name == "benchmark":
+            command_parser.add_argument("--output", default=None, help="JSON file for the results")
+        if name == "measure":
+            command_parser.add_argument("--backend", choices=EMBED_BACKENDS, required=True)
+    args = parser.parse_args()
+
+    chatbot_logger = chatbot_logger(logLevel=30 if args.command == "measure" else 20)
+
+    if args.command == "export":
+        export_onnx_model(args.output_dir)
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    elif args.command == "benchmark":
+        benchmark(args)
+    else:
+        measure(args)
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import warnings
+
+from src import config
+from src.ChatBot import Course, set_directories
+from src.discord.DiscordBot import DiscordBot
+from src.discord.FakeChannel import FakeUser
+from src.helpers.BatchAnswering import load_batch
+from src.helpers.KeepAliveOllama import KeepAliveOllama
+from src.helpers.LoadTest import (TimedScheduler, run_load_test,
+                                  saturation_point)
+from src.helpers.StubOllama import StubOllamaServer
+from src.logger import (chatbot_logger, message_logger, query_logger,
+                        unanswered_questions_logger)
+
+warnings.filterwarnings(
+    "ignore", message=".*Torch was not compiled with flash attention.*")
+
+
+def seconds(value) -> str:
+    return "-" if value is None else f"{value:.2f}s"
+
+
+if __name__ == "__main__":
+    # Find the arrival rate at which the bot saturates, with a local stand-in for Ollama generating 20 tokens/s, e.g.
+    # python loadtest.py questions.jsonl --rates 0.05 0.1 0.2 0.5 --duration 120 --token-rate 20 --concurrency 2
+    # python loadtest.py questions.jsonl --ollama-url http://localhost:11434 --rates 0.1 0.2
+    parser = argparse.ArgumentParser(description="Load test of the Discord message path without Discord")
+    parser.add_argument("questions", help="JSONL file with question and course per line, as for batch.py")
+    parser.add_argument("--course", default=None, help="course of questions without a course")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.05, 0.1, 0.2, 0.5, 1.0],
+                        help="questions per second of the steps")
+    parser.add_argument("--duration", type=float, default=60, help="seconds questions arrive in each step")
+    parser.add_argument("--all-rates", action="store_true", help="continue with higher rates after saturation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ollama-url", default=None, help="use this Ollama server instead of the stand-in")
+    parser.add_argument("--token-rate", type=float, default=20, help="tokens/s generated by the stand-in")
+    parser.add_argument("--prompt-rate", type=float, default=200, help="prompt tokens/s processed by the stand-in")
+    parser.add_argument("--answer-tokens", type=int, default=80, help="tokens of each answer of the stand-in")
+    parser.add_argument("--ollama-parallel", type=int, default=1,
+                        help="requests the stand-in processes at the same time, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get('QUERY_CONCURRENCY', 1)))
+    parser.add_argument("--queue-size", type=int, default=int(os.environ.get('QUERY_QUEUE_SIZE', 20)))
+    parser.add_argument("--stream", action="store_true", help="stream the answers like STREAM_RESPONSES")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="keep the answer cache, repeated questions are then answered from it")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    args = parser.parse_args()
+
+    # Loggers
+    chatbot_logger = chatbot_logger(logLevel=20)
+    message_logger = message_logger(logLevel=30)
+    unanswered_questions_logger = unanswered_questions_logger(logLevel=30)
+    query_logger = query_logger(logLevel=30)
+
+    items = load_batch(args.questions, default_course=args.course)
+    set_directories(config.DOCUMENTS_DIR, config.INDEX_DIR)
+    unknown = {item["course"] for item in items} - {course.value for course in Course.discover()}
+    if unknown:
+        parser.error(f"unknown courses: {', '.join(sorted(unknown))}")
+    stub = None
+    if args.ollama_url is None:
+        stub = StubOllamaServer(token_rate=args.token_rate, prompt_rate=args.prompt_rate,
+                                answer_tokens=args.answer_tokens, parallel=args.ollama_parallel)
+        stub.start()
+    llm = KeepAliveOllama(model="llama3.1", base_url=args.ollama_url or stub.url, request_timeout=360.0,
+                          keep_alive=config.OLLAMA_KEEP_ALIVE, context_window=config.OLLAMA_CONTEXT_WINDOW)
+
+    overrides = {} if args.answer_cache else {"answer_cache_size": 0}
+    chat_bot = config.create_chatbot(llm=llm, **overrides)
+    if config.WARM_UP:
+        try:
+            chat_bot.warmer.warm_up()
+        except Exception as e:
+            # the questions of the first step then also load the models, or fail and are counted as errors
+            chatbot_logger.warning(f"Warm-up failed: {e!r}")
+    for course in sorted({item["course"] for item in items}):
+        # load the indexes before the first step
+        chat_bot.engine(Course(course))
+
+    scheduler = TimedScheduler(max_concurrency=args.concurrency, max_queue_size=args.queue_size)
+    bot = DiscordBot(chat_bot, scheduler, stream_responses=args.stream)
+    # the bot never logs in, its user is only needed to recognize its own messages
+    bot._connection.user = FakeUser(0, "bot")
+
+    steps = asyncio.run(run_load_test(bot, scheduler, items, args.rates, args.duration, seed=args.seed,
+                                      stop_when_saturated=not args.all_rates))
+    saturated_at = saturation_point(steps)
+
+    results = {
+        "config": {
+            "ollama": args.ollama_url or {"token_rate": args.token_rate, "prompt_rate": args.prompt_rate,
+                                          "answer_tokens": args.answer_tokens, "parallel": args.ollama_parallel},
+            "concurrency": args.concurrency,
+            "queue_size": args.queue_size,
+            "stream": args.stream,
+            "answer_cache": args.answer_cache,
+            "query_mode": chat_bot.query_mode,
+            "duration": args.duration,
+            "seed": args.seed,
+            "questions": len(items),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "steps": steps,
+        "saturation_point": saturated_at,
+    }
+    output = args.output or f"temp/loadtest_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2, ensure_ascii=False)
+
+    print(f"{'rate/s':>7} {'sent':>5} {'ok':>5} {'rej':>4} {'err':>4} {'tput/s':>7} "
+          f"{'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'queue p50':>9} {'queue p95':>9}")
+    for step in steps:
+        print(f"{step['rate']:7.3f} {step['arrivals']:5d} {step['answered']:5d} {step['rejected']:4d} "
+              f"{step['errors']:4d} {step['throughput']:7.3f} {seconds(step['latency_p50']):>7} "
+              f"{seconds(step['latency_p95']):>7} {seconds(step['latency_p99']):>7} "
+              f"{seconds(step['latency_max']):>7} {seconds(step['queue_delay_p50']):>9} "
+              f"{seconds(step['queue_delay_p95']):>9}{'  saturated' if step['saturated'] else ''}")
+    if saturated_at is None:
+        print(f"not saturated up to {max(args.rates):g} questions/s")
+    else:
+        print(f"saturated at {saturated_at:g} questions/s")
+    print(f"results written to {output}")
@@ -0,0 +1,102 @@
+import argparse
+import glob
+import gzip
+import json
+import time
+from collections import Counter
+
+from src.helpers.Benchmark import percentile
+
+
+def log_files(log_file: str) -> list:
+    """The query log and its rotated, compressed backups, oldest first"""
+    backups = glob.glob(f"{glob.escape(log_file)}.*.gz")
+    backups.sort(key=lambda path: int(path[len(log_file) + 1:-len(".gz")]), reverse=True)
+    return backups + [log_file]
+
+
+def read_records(log_file: str, since: float = None):
+    """
+    Yield the records of the query log including the rotated files
+    :param log_file: path of the current log file
+    :param since: only records from this unix timestamp on
+    :return:
+    """
+    for path in log_files(log_file):
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if since is None or time.mktime(time.strptime(record["timestamp"], "%Y-%m-%dT%H:%M:%S")) >= since:
+                        yield record
+        except FileNotFoundError:
+            continue
+
+
+def aggregate(records, top: int = 10) -> dict:
+    """
+    Counts, answer rate, latency percentiles, most frequent unanswered questions and most cited sources
+    :param records: query log records
+    :param top: entries of the rankings
+    :return:
+    """
+    total, answered, cached = 0, 0, 0
+    latencies = {}
+    courses = Counter()
+    unanswered = Counter()
+    sources = Counter()
+    for record in records:
+        total += 1
+        answered += record["answered"]
+        cached += record["cached"]
+        courses[record["course"]] += 1
+        latencies.setdefault(record["mode"], []).append(record["latency"])
+        if not record["answered"]:
+            unanswered[" ".join(record["query"].lower().split())] += 1
+        for source in record["sources"]:
+            sources[source["file"]] += 1
+
+    return {
+        "queries": total,
+        "answered": answered / total if total else 0.0,
+        "cached": cached / total if total else 0.0,
+        "courses": dict(courses),
+        "latency": {mode: {"p50": percentile(values, 50), "p95": percentile(values, 95), "max": max(values)}
+                    for mode, values in latencies.items()},
+        "top_unanswered": unanswered.most_common(top),
+        "top_sources": sources.most_common(top),
+    }
+
+
+if __name__ == "__main__":
+    # Statistics of the query log, e.g.
+    # python log_stats.py --days 7 --top 20
+    parser = argparse.ArgumentParser(description="Aggregate the structured query log")
+    parser.add_argument("--log-file", default="temp/queries.jsonl")
+    parser.add_argument("--days", type=float, default=None, help="only queries of the last days")
+    parser.add_argument("--top", type=int, default=10, help="entries of the rankings")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    args = parser.parse_args()
+
+    since = time.time() - args.days * 24 * 60 * 60 if args.days else None
+    stats = aggregate(read_records(args.log_file, since), top=args.top)
+
+    if args.json:
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+    else:
+        print(f"queries   {stats['queries']}")
+        print(f"answered  {stats['answered']:.1%}")
+        print(f"cached    {stats['cached']:.1%}")
+        print(f"courses   {', '.join(f'{course}: {count}' for course, count in stats['courses'].items())}")
+        for mode, latency in stats["latency"].items():
+            print(f"latency   {mode}: p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, max {latency['max']:.2f}s")
+        print("\nMost frequent unanswered questions:")
+        for question, count in stats["top_unanswered"]:
+            print(f"{count:5}  {question}")
+        print("\nMost cited sources:")
+        for source, count in stats["top_sources"]:
+            print(f"{count:5}  {source}")
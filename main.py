@@ -1,3 +1,4 @@
+import sys
 import time
 import warnings
 
@@ -18,12 +19,12 @@ if __name__ == "__main__":
     # Start time
     start_time = time.time()
 
-    # Set course
-    course = Course.IT
-
     # setup Bot
     chat_bot = ChatBot()
 
+    # Set course, courses are known once the documents directory is set
+    course = Course("it")
+
     # # Perform RAG query
     # query = "In welcher Straße befindet sich die DHBW?"
     # result = chat_bot.perform_query(query, course)
@@ -34,6 +35,13 @@ if __name__ == "__main__":
     elapsed_time = end_time - start_time
     chatbot_logger.debug(f"Elapsed time: {elapsed_time:.2f} seconds")
 
+    # Compare per-query setup overhead: python main.py --measure-overhead
+    if "--measure-overhead" in sys.argv:
+        overhead = chat_bot.measure_setup_overhead(course)
+        print(f"Per-query setup, index rebuilt from disk: {overhead['rebuild']:.3f} seconds")
+        print(f"Per-query setup, resident index: {overhead['resident']:.3f} seconds")
+        sys.exit(0)
+
     # # Loop for chat
     while True:
         query = input("\nFrage: ")
@@ -1,65 +1,172 @@
 import json
 import logging
 import os
-from enum import Enum
+import threading
+import time
+from dataclasses import replace
 
 import torch
 from llama_index.core import (Settings, SimpleDirectoryReader, StorageContext,
                               VectorStoreIndex, load_index_from_storage)
 from llama_index.core.agent import ReActAgent
+from llama_index.core.callbacks import CallbackManager
 from llama_index.core.query_engine import CitationQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import QueryBundle
 from llama_index.core.tools import FunctionTool, QueryEngineTool, ToolMetadata
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.ollama import Ollama
 
+from src.Course import Course, set_directories
+from src.helpers.AnswerCache import AnswerCache
+from src.helpers.ContextPacker import ContextPacker
+from src.helpers.DirectoryWatcher import DirectoryWatcher
+from src.helpers.DocumentIngestor import DocumentIngestor
+from src.helpers.EmbeddingBackend import create_embed_model
+from src.helpers.EmbeddingCache import (EMBEDDING_CACHE_FNAME, CachedEmbedding,
+                                       EmbeddingCache)
+from src.helpers.HybridRetriever import HybridRetriever
+from src.helpers.IndexManifest import (SOURCES_FNAME, IndexManifest,
+                                       document_file_name)
+from src.helpers.IndexRegistry import (CourseEngine, IndexRegistry,
+                                       directory_size)
+from src.helpers.IndexVersions import (current_dir, current_version,
+                                       load_current, persist_version)
+from src.helpers.KeepAliveOllama import KeepAliveOllama
+from src.helpers.MetricsCallbackHandler import MetricsCallbackHandler
+from src.helpers.MmapVectorStore import MmapVectorStore
+from src.helpers.ModelWarmer import ModelWarmer
 from src.helpers.PriorityNodeScoreProcessor import PriorityNodeScoreProcessor
 from src.helpers.RagPrompt import rag_messages, rag_template
 from src.helpers.SystemMessage import system_message
+from src.metrics import ITERATION_BUCKETS, metrics
+from src.QueryResult import ERROR_ANSWER, QueryResult
 
 message_logger = logging.getLogger('Messages')
 chatbot_logger = logging.getLogger('ChatBot')
 unanswered_questions_logger = logging.getLogger('UnansweredQuestions')
+query_logger = logging.getLogger('Queries')
 
-DATA_DIR = ""
-PERSIST_DIR = ""
+QUERY_MODES = ("agent", "direct")
+# "dense": vector similarity reweighted by priority, "hybrid": dense and BM25 fused with priority before the cutoff
+RETRIEVAL_MODES = ("dense", "hybrid")
 
+# answers containing this phrase are treated as "cannot answer"
+UNANSWERED_PHRASE = "nicht beantworten"
 
-class Course(Enum):
-    WI = "wi"
-    IT = "it"
 
-    def data_dir(self) -> str:
-        return DATA_DIR + "/" + self.value
+def strip_answer_prefix(answer: str) -> str:
+    """Remove the "Answer:" prefix the prompts ask the LLM for"""
+    answer = answer.strip()
+    return answer[len("Answer:"):].lstrip() if answer.startswith("Answer:") else answer
 
-    def persist_dir(self) -> str:
-        return PERSIST_DIR + "/" + self.value
+
+def strip_stream_answer_prefix(tokens):
+    """Remove the "Answer:" prefix from a stream of tokens"""
+    start = ""
+    for token in tokens:
+        if start is None:
+            yield token
+            continue
+        start += token
+        if len(start.lstrip()) >= len("Answer:") or not "Answer:".startswith(start.lstrip()):
+            yield strip_answer_prefix(start) if start.lstrip().startswith("Answer:") else start
+            start = None
+    if start:
+        yield strip_answer_prefix(start)
+
+
+def is_answered(answer: str) -> bool:
+    return UNANSWERED_PHRASE not in answer
 
 
 class ChatBot(object):
-    def __init__(self, documents_dir="./data/documents", index_dir="./data/index"):
+    def __init__(self, documents_dir="./data/documents", index_dir="./data/index", vector_dtype="float32",
+                 answer_cache_threshold=0.95, answer_cache_size=256, answer_cache_ttl=24 * 60 * 60,
+                 query_mode="agent", min_answer_score=0.4, llm=None, ingest_workers=None, embed_batch_size=32,
+                 embedding_cache_size=500000, query_embedding_cache_size=1024, embed_backend="torch",
+                 onnx_model_path=None, embed_threads=None, retrieval_mode="hybrid", ollama_keep_alive=None,
+                 context_window=3900, keep_warm_interval=240, keep_warm_hours=None, index_memory_budget=0,
+                 preload_courses=(), read_only_index=False, watch_interval=10, watch_debounce=30,
+                 context_packing=True, context_token_budget=1500):
         chatbot_logger.info("ChatBot Initializing...")
 
+        if query_mode not in QUERY_MODES:
+            raise ValueError(f"Unsupported query mode {query_mode}, expected one of {QUERY_MODES}")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode {retrieval_mode}, expected one of {RETRIEVAL_MODES}")
+        self.retrieval_mode = retrieval_mode
+        # "agent": ReAct agent decides on tool calls, "direct": one retrieval and one synthesis step
+        self.query_mode = query_mode
+        # direct mode: questions without a retrieved node scoring at least this are logged as unanswered
+        self.min_answer_score = min_answer_score
+
         # allow parameterization of data and index directories
-        global DATA_DIR, PERSIST_DIR
-        DATA_DIR = documents_dir
-        PERSIST_DIR = index_dir
+        set_directories(documents_dir, index_dir)
+        # another process maintains the indexes, they are only loaded
+        self.read_only_index = read_only_index
+
+        # time embedding, retrieval, synthesis, LLM calls and agent steps
+        Settings.callback_manager = CallbackManager([MetricsCallbackHandler()])
 
         # Check if CUDA is available
         device = "cuda" if torch.cuda.is_available() else "cpu"
         chatbot_logger.info(f"Using device: {device}")
 
-        # Embeddings model
-        Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-m3")
-
-        # Language model
-        Settings.llm = Ollama(
-            model="llama3.1", request_timeout=360.0, device=device)
-
-        for course in Course:
-            self.__load_index(course)
-            self.refresh_index(course)
+        # Embeddings model, chunk embeddings are cached on disk by content and shared by all courses
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(index_dir, EMBEDDING_CACHE_FNAME), max_entries=embedding_cache_size) \
+            if embedding_cache_size > 0 else None
+        embed_model = create_embed_model(embed_backend, onnx_model_path=onnx_model_path, threads=embed_threads,
+                                         embed_batch_size=embed_batch_size)
+        Settings.embed_model = CachedEmbedding(
+            embed_model, cache=self.embedding_cache, query_cache_size=query_embedding_cache_size)
+
+        # Language model, can be replaced e.g. by a stand-in for benchmarks. Ollama keeps the model loaded for
+        # keep_alive after each request; all requests use the same context size, a different one reloads the model.
+        Settings.llm = llm or KeepAliveOllama(
+            model="llama3.1", request_timeout=360.0, device=device, keep_alive=ollama_keep_alive,
+            context_window=context_window)
+
+        # loads both models before the first question and keeps them loaded
+        self.warmer = ModelWarmer(Settings.llm, embed_model, interval=keep_warm_interval, hours=keep_warm_hours)
+
+        # shrinks the retrieved context before it is passed to the LLM, fewer prompt tokens shorten the prefill
+        self.context_packer = ContextPacker(token_budget=context_token_budget) if context_packing else None
+
+        # storage type of the embeddings: float32, float16 or int8
+        self.vector_dtype = vector_dtype
+
+        # parses changed files in parallel and embeds their chunks in batches
+        self.ingestor = DocumentIngestor(
+            Settings.embed_model, Settings.transformations, workers=ingest_workers, embed_batch_size=embed_batch_size)
+
+        # loaded indexes and query engines, built on the first question of a course and swapped on refresh
+        self.__registry = IndexRegistry(memory_budget=index_memory_budget)
+        self.__load_locks = {}
+        self.__load_locks_lock = threading.Lock()
+
+        # refreshes loaded courses when their documents change, or when another process updated their index
+        self.watcher = DirectoryWatcher(index_dir if read_only_index else documents_dir, self.__directory_changed,
+                                        interval=watch_interval, debounce=watch_debounce)
+
+        # answers to previous questions, reused for similar questions
+        self.answer_cache = AnswerCache(
+            threshold=answer_cache_threshold, max_entries=answer_cache_size, ttl=answer_cache_ttl)
+
+        chatbot_logger.info(f"Courses: {', '.join(course.value for course in Course)}")
+        for course in preload_courses:
+            self.engine(Course(course))
         chatbot_logger.info("ChatBot Initialized.")
 
+    def load_sources(self, course: Course) -> dict:
+        """
+        Load sources.json of a course
+        :param course:
+        :return: source entries by file name
+        """
+        with open(os.path.join(course.data_dir(), SOURCES_FNAME), encoding="utf-8") as sources_file:
+            sources_json = json.load(sources_file)
+        return {source["file"]: source for source in sources_json["sources"]}
+
     def get_source_info(self, course, document):
         """
         Get source info for certain file
@@ -67,25 +174,22 @@ class ChatBot(object):
         :param document:
         :return:
         """
-        with open(os.path.join(course.data_dir(), "sources.json")) as sources_file:
-            sources_json = json.load(sources_file)
+        return self.load_sources(course).get(document.metadata["file_name"])
 
-            for source in sources_json["sources"]:
-                if source["file"] == document.metadata["file_name"]:
-                    return source
-
-    def enrich_metadata(self, documents, course):
+    def enrich_metadata(self, documents, course, sources: dict = None):
         """
         Enrich documents with metadata from sources.json
         :param documents: documents loaded from directory
         :param course: active course
+        :param sources: already loaded sources.json entries (optional)
         :return:
         """
         chatbot_logger.debug("Enriching metadata...")
+        sources = sources if sources is not None else self.load_sources(course)
         for document in documents:
-            if document.metadata["file_name"] == "sources.json":
+            if document.metadata["file_name"] == SOURCES_FNAME:
                 continue
-            source_info = self.get_source_info(course, document)
+            source_info = sources.get(document.metadata["file_name"])
             if source_info is None:
                 chatbot_logger.warning(
                     f'file {document.metadata["file_name"]} not loaded. No proper entry in sources.json for this file')
@@ -98,67 +202,216 @@ class ChatBot(object):
                 "description": source_info["description"],
             })
 
-    def __load_documents(self, course: Course):
+    def __load_documents(self, course: Course, files: list, sources: dict):
         """
         Loads documents for vector store
         :param course:
+        :param files: paths of the files to load
+        :param sources: sources.json entries by file name
         :return:
         """
+        if not files:
+            return []
         documents = SimpleDirectoryReader(
-            course.data_dir(), filename_as_id=True).load_data()
-        self.enrich_metadata(documents, course)
-
-        # Filter documents
-        filtered_documents = [doc for doc in documents if doc.metadata.get(
-            "file_name") != "sources.json"]
-
-        return filtered_documents
+            input_files=files, filename_as_id=True).load_data()
+        self.enrich_metadata(documents, course, sources)
+        return documents
 
     def __load_index(self, course: Course) -> VectorStoreIndex:
-        """Load index from storage or create a new one from documents in the given directory."""
+        """Load index from storage or create an empty one if none is persisted yet."""
         chatbot_logger.info("Loading index...")
-        documents = self.__load_documents(course)
+        with metrics.span("index_load", course=course.value):
+            return self.__load_or_create_index(course)
+
+    def __load_or_create_index(self, course: Course) -> VectorStoreIndex:
+        def load(persist_dir: str) -> VectorStoreIndex:
+            vector_store = MmapVectorStore.from_persist_dir(persist_dir, dtype=self.vector_dtype)
+            storage_context = StorageContext.from_defaults(persist_dir=persist_dir, vector_store=vector_store)
+            return load_index_from_storage(storage_context)
 
         try:
             # Try load index from storage
             chatbot_logger.debug("Loading index from storage...")
-            storage_context = StorageContext.from_defaults(
-                persist_dir=course.persist_dir())
-            index = load_index_from_storage(storage_context)
+            return load_current(course.persist_dir(), load)
         except FileNotFoundError:
-            # Create index from documents and persist it
-            chatbot_logger.debug("Creating index from documents...")
-            index = VectorStoreIndex.from_documents(
-                documents, show_progress=True)
-            index.storage_context.persist(persist_dir=course.persist_dir())
-        return index
-
-    def __delete_missing_docs(self, course: Course) -> VectorStoreIndex:
-        """Delete documents from the index that are missing on disk."""
-        index = self.__load_index(course)
-        chatbot_logger.info("Checking for missing documents...")
-        for id, doc in index.ref_doc_info.items():
-            if not os.path.exists(doc.metadata['file_path']):
-                chatbot_logger.debug(
-                    f"Deleting missing document: {doc.metadata['file_path']}")
-                index.delete_ref_doc(id, delete_from_docstore=True)
-        index.storage_context.persist(persist_dir=course.persist_dir())
-        return index
+            chatbot_logger.debug("No index in storage, creating a new one...")
+            storage_context = StorageContext.from_defaults(
+                vector_store=MmapVectorStore(dtype=self.vector_dtype))
+            return VectorStoreIndex(nodes=[], storage_context=storage_context)
 
     def refresh_index(self, course: Course):
-        """ Update documents in vector store"""
+        """
+        Update documents in vector store. Only files that were added, changed, removed or whose sources.json entry
+        changed since the last refresh are parsed and embedded, compared by the manifest stored next to the index.
+        With a read-only index the persisted index is only loaded.
+        """
         chatbot_logger.info("Refreshing index...")
         chatbot_logger.debug(f"Course: {course}")
         chatbot_logger.debug(f"Data dir: {course.data_dir()}")
         chatbot_logger.debug(f"Persist dir: {course.persist_dir()}")
-        storage_context = StorageContext.from_defaults(
-            persist_dir=course.persist_dir())
-        index = load_index_from_storage(storage_context)
-        index = self.__delete_missing_docs(course)
-        documents = self.__load_documents(course)
 
-        index.refresh_ref_docs(documents)
-        index.storage_context.persist(persist_dir=course.persist_dir())
+        index = self.__load_index(course)
+        if self.read_only_index:
+            if not index.ref_doc_info:
+                chatbot_logger.warning(f"No index of {course} in {course.persist_dir()}")
+            self.__registry.swap(course, self.build_engine(index),
+                                 size=directory_size(current_dir(course.persist_dir())))
+            # the reloaded index may contain other documents than the one the answers were cached for
+            self.answer_cache.invalidate(course)
+            return
+
+        manifest = IndexManifest.load(course.persist_dir())
+        if not index.ref_doc_info:
+            # index was (re)created, everything on disk is new
+            manifest = IndexManifest()
+
+        sources = self.load_sources(course)
+        current = manifest.scan(course.data_dir(), sources)
+        diff = manifest.diff(current)
+        chatbot_logger.info(f"Document changes: {diff}")
+
+        if diff:
+            # drop outdated documents as well as documents of files no longer known
+            outdated = set(diff.added + diff.changed + diff.removed)
+            for ref_doc_id, doc in index.ref_doc_info.items():
+                file_name = document_file_name(doc.metadata.get("file_path", ""))
+                if file_name in outdated or file_name not in current.entries:
+                    chatbot_logger.debug(f"Deleting document: {ref_doc_id}")
+                    index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+
+            files = [current.entries[file_name]["path"] for file_name in diff.added + diff.changed]
+            self.ingestor.ingest(index, files, prepare=lambda documents: self.enrich_metadata(documents, course, sources))
+            if self.embedding_cache is not None:
+                chatbot_logger.info(f"Embedding cache: {self.embedding_cache.stats()}")
+
+            self.__persist_index(course, index)
+        elif index.ref_doc_info and current_version(course.persist_dir()) is None:
+            # index persisted by an older version directly into the course directory
+            self.__persist_index(course, index)
+
+        if diff or current.entries != manifest.entries:
+            # also record new mtimes of files with unchanged content
+            current.persist(course.persist_dir())
+
+        # queries running on the previous engine finish on it
+        self.__registry.swap(course, self.build_engine(index),
+                             size=directory_size(current_dir(course.persist_dir())))
+        if diff:
+            # queries still running on the previous engine started in the previous generation, their answers are not
+            # cached anymore
+            self.answer_cache.invalidate(course)
+
+    @staticmethod
+    def __persist_index(course: Course, index: VectorStoreIndex):
+        """
+        Write the index as a new version, processes loading it meanwhile get the previous version
+        :param course:
+        :param index:
+        :return:
+        """
+        version = persist_version(
+            course.persist_dir(), lambda directory: index.storage_context.persist(persist_dir=directory))
+        chatbot_logger.info(f"Persisted index of {course} as version {version}")
+
+    def build_engine(self, index: VectorStoreIndex) -> CourseEngine:
+        """
+        Build retriever and query engine for a loaded index
+        :param index:
+        :return: engine to be stored in the registry
+        """
+        retriever = self.build_retriever(index)
+
+        # RAG engine to receive data from documents
+        query_engine = CitationQueryEngine.from_args(
+            index,
+            retriever=retriever,
+            citation_chunk_size=512,
+            node_postprocessors=self.node_postprocessors()
+        )
+
+        # engines answering directly with the RAG prompt, without agent
+        direct_engines = [
+            CitationQueryEngine.from_args(
+                index,
+                retriever=retriever,
+                citation_chunk_size=512,
+                citation_qa_template=rag_template,
+                node_postprocessors=self.node_postprocessors(),
+                streaming=streaming
+            )
+            for streaming in (False, True)
+        ]
+        return CourseEngine(index=index, retriever=retriever, query_engine=query_engine,
+                            direct_engine=direct_engines[0], direct_streaming_engine=direct_engines[1])
+
+    def build_retriever(self, index: VectorStoreIndex, similarity_top_k: int = 3) -> BaseRetriever:
+        """
+        Build the retriever of the configured retrieval mode
+        :param index:
+        :param similarity_top_k: number of retrieved nodes
+        :return:
+        """
+        if self.retrieval_mode == "hybrid":
+            return HybridRetriever(index, similarity_top_k=similarity_top_k)
+        return index.as_retriever(similarity_top_k=similarity_top_k)
+
+    def node_postprocessors(self, pack_context: bool = True) -> list:
+        """
+        Postprocessors of the retrieved nodes; the hybrid retriever already applies the priority
+        :param pack_context: include the context packer, if enabled
+        :return:
+        """
+        postprocessors = [] if self.retrieval_mode == "hybrid" else [PriorityNodeScoreProcessor()]
+        if pack_context and self.context_packer is not None:
+            postprocessors.append(self.context_packer)
+        return postprocessors
+
+    def engine(self, course: Course) -> CourseEngine:
+        """
+        Get the resident engine of a course, the index is loaded and refreshed on first use
+        :param course:
+        :return:
+        """
+        try:
+            return self.__registry.get(course)
+        except KeyError:
+            pass
+        # concurrent first questions of a course load its index only once
+        with self.__load_lock(course):
+            if course not in self.__registry:
+                self.refresh_index(course)
+            return self.__registry.get(course)
+
+    def __load_lock(self, course: Course) -> threading.Lock:
+        """Lock held while the index of a course is loaded or refreshed"""
+        with self.__load_locks_lock:
+            return self.__load_locks.setdefault(course, threading.Lock())
+
+    def __directory_changed(self, name: str):
+        """
+        Refresh the index of a changed course off the request path, if it is loaded; courses that are not loaded are
+        refreshed when they are loaded
+        :param name: subdirectory of the documents directory, or of the index directory with a read-only index
+        :return:
+        """
+        loaded = {course.value: course for course in self.loaded_courses()}
+        if name not in loaded:
+            return
+        try:
+            course = Course(name)
+        except ValueError:
+            chatbot_logger.info(f"Course {name} was removed, unloading its index")
+            self.__registry.remove(loaded[name])
+            self.answer_cache.invalidate(loaded[name])
+            return
+
+        chatbot_logger.info(f"Files of course {name} changed, refreshing its index")
+        with self.__load_lock(course), metrics.span("index_reload", course=name):
+            self.refresh_index(course)
+
+    def loaded_courses(self) -> list:
+        """Courses with a loaded index, least recently used first"""
+        return self.__registry.loaded()
 
     def log_unanswered_question(self, question: str):
         """
@@ -178,18 +431,8 @@ class ChatBot(object):
         :param course: the desired course
         :return: agent to chat with
         """
-        index = self.__load_index(course)
-
-        # RAG engine to receive data from documents
-        query_engine = CitationQueryEngine.from_args(
-            index,
-            similarity_top_k=3,
-            citation_chunk_size=512,
-            node_postprocessors=[PriorityNodeScoreProcessor()]
-        )
-
         rag_tool = QueryEngineTool(
-            query_engine=query_engine,
+            query_engine=self.engine(course).query_engine,
             metadata=ToolMetadata(
                 name="rag_tool",
                 description=(
@@ -208,6 +451,29 @@ class ChatBot(object):
             verbose=True,
             max_iterations=10)
 
+    def measure_setup_overhead(self, course: Course, runs: int = 3) -> dict:
+        """
+        Compare the per-query setup cost of rebuilding the index from disk (previous behaviour) with the resident engine
+        :param course:
+        :param runs: number of repetitions to average over
+        :return: average seconds per query setup for both variants
+        """
+        rebuild_start = time.perf_counter()
+        for _ in range(runs):
+            files = [os.path.join(course.data_dir(), file_name) for file_name in os.listdir(course.data_dir())
+                     if file_name != SOURCES_FNAME]
+            self.__load_documents(course, files, self.load_sources(course))
+            ReActAgent.from_tools(tools=[QueryEngineTool.from_defaults(
+                self.build_engine(self.__load_index(course)).query_engine)])
+        rebuild = (time.perf_counter() - rebuild_start) / runs
+
+        resident_start = time.perf_counter()
+        for _ in range(runs):
+            self.__create_agent(course)
+        resident = (time.perf_counter() - resident_start) / runs
+
+        return {"rebuild": rebuild, "resident": resident}
+
     def build_sources_output(self, ai_response, max_sources=None):
         """
         Build sources string for output, combining sources of the same type with multiple page references
@@ -244,25 +510,243 @@ class ChatBot(object):
 
         return output
 
-    def perform_query(self, query: str, course: Course):
+    def __cached_answer(self, query: str, course: Course):
         """
-        Run chat query
+        Look up the answer cache for a query
+        :param query:
+        :param course:
+        :return: query embedding, generation of the answer cache of the course and cached result (None if there is none)
+        """
+        # taken before the engine is looked up, so answers of an engine replaced meanwhile are not cached
+        generation = self.answer_cache.generation(course)
+        query_embedding = Settings.embed_model.get_query_embedding(query)
+        cached_result = self.answer_cache.get(course, query_embedding)
+        if cached_result is not None:
+            message_logger.info(
+                f"Course: {course} \t Query: {query} \t response (cached): {cached_result}")
+            cached_result = replace(cached_result, cached=True)
+        return query_embedding, generation, cached_result
+
+    def __finish_query(self, query: str, course: Course, query_embedding, generation: int, result: QueryResult):
+        """
+        Log the result of a query and cache it
+        :param query:
+        :param course:
+        :param query_embedding:
+        :param generation: generation of the answer cache when the query started
+        :param result:
+        :return:
+        """
+        message_logger.info(
+            f"Course: {course} \t Query: {query} \t response: {result}")
+
+        metrics.inc("queries_total", answered=result.answered)
+
+        # unanswered questions are not cached, so that every occurrence gets logged
+        if result.answered:
+            self.answer_cache.put(course, query_embedding, result, generation=generation)
+
+    @staticmethod
+    def __log_query(query: str, course: Course, mode: str, result: QueryResult, latency: float):
+        """
+        Write a structured record of a query to the query log
+        :param query:
+        :param course:
+        :param mode:
+        :param result:
+        :param latency: seconds until the complete answer was available
+        :return:
+        """
+        query_logger.info(query, extra={"fields": {
+            "course": course.value,
+            "mode": mode,
+            "query": query,
+            "latency": round(latency, 3),
+            "answered": result.answered,
+            "cached": result.cached,
+            "sources": result.source_references(),
+        }})
+
+    def __unanswered(self, query: str) -> QueryResult:
+        """
+        Log a question the retrieved documents cannot answer, without asking the LLM
+        :param query:
+        :return:
+        """
+        answer = self.log_unanswered_question(query)
+        return QueryResult(answer=strip_answer_prefix(answer), answered=False)
+
+    def __direct_retrieve(self, query: str, course: Course, query_embedding, streaming: bool = False):
+        """
+        Retrieve the nodes for a direct query
+        :param query:
+        :param course:
+        :param query_embedding: embedding of the query, reused for retrieval
+        :param streaming: use the streaming query engine
+        :return: query engine, query bundle and nodes; nodes is None if no node is relevant enough to answer
+        """
+        engine = self.engine(course)
+        query_engine = engine.direct_streaming_engine if streaming else engine.direct_engine
+        query_bundle = QueryBundle(query, embedding=query_embedding)
+        nodes = query_engine.retrieve(query_bundle)
+        best_score = max((node.score or 0 for node in nodes), default=0)
+        chatbot_logger.debug(f"Best retrieval score: {best_score:.3f}")
+        if best_score < self.min_answer_score:
+            return query_engine, query_bundle, None
+        return query_engine, query_bundle, nodes
+
+    def __direct_answer(self, query: str, course: Course, query_embedding) -> QueryResult:
+        """
+        Answer a query with one retrieval and one synthesis step
+        :param query:
+        :param course:
+        :param query_embedding:
+        :return:
+        """
+        query_engine, query_bundle, nodes = self.__direct_retrieve(query, course, query_embedding)
+        if nodes is None:
+            return self.__unanswered(query)
+
+        response = query_engine.synthesize(query_bundle, nodes)
+        answer = strip_answer_prefix(response.response)
+        answered = is_answered(answer)
+        if not answered:
+            self.log_unanswered_question(query)
+        return QueryResult(answer=answer, sources=self.build_sources_output(response),
+                           answered=answered, source_nodes=response.source_nodes)
+
+    def __agent_answer(self, query: str, course: Course) -> QueryResult:
+        """
+        Answer a query with the ReAct agent
         :param query:
         :param course:
         :return:
         """
-        chatbot_logger.info(f"Performing query")
+        setup_start = time.perf_counter()
+        with metrics.span("agent_create"):
+            agent = self.__create_agent(course)
+        chatbot_logger.debug(
+            f"Agent setup took {time.perf_counter() - setup_start:.3f} seconds")
+
+        response = agent.chat(query)
+        self.__record_agent_iterations(agent)
+        answered = not any(tool_output.tool_name == "log_unanswered_question" for tool_output in response.sources)
+        return QueryResult(answer=response.response, sources=self.build_sources_output(response),
+                           answered=answered, source_nodes=response.source_nodes)
+
+    @staticmethod
+    def __record_agent_iterations(agent: ReActAgent):
+        iterations = sum(len(agent.get_completed_steps(task.task_id)) for task in agent.get_completed_tasks())
+        metrics.observe("agent_iterations", iterations, buckets=ITERATION_BUCKETS)
+
+    def answer(self, query: str, course: Course, mode: str = None) -> QueryResult:
+        """
+        Run chat query
+        :param query:
+        :param course:
+        :param mode: "agent" or "direct", defaults to the configured query mode
+        :return: answer, sources and whether the question could be answered
+        """
+        mode = mode or self.query_mode
+        chatbot_logger.info(f"Performing query ({mode})")
         chatbot_logger.debug(f"Query: {query}")
         chatbot_logger.debug(f"Course: {course}")
-        agent = self.__create_agent(course)
 
+        start = time.perf_counter()
+        with metrics.span("query", mode=mode):
+            result = self.__answer(query, course, mode)
+        self.__log_query(query, course, mode, result, time.perf_counter() - start)
+        return result
+
+    def __answer(self, query: str, course: Course, mode: str) -> QueryResult:
         try:
-            response = agent.chat(query)
-            message_logger.info(
-                f"Course: {course} \t Query: {query} \t response: {response}")
+            query_embedding, generation, cached_result = self.__cached_answer(query, course)
+            if cached_result is not None:
+                return cached_result
+
+            if mode == "direct":
+                result = self.__direct_answer(query, course, query_embedding)
+            else:
+                result = self.__agent_answer(query, course)
+        except Exception as e:
+            chatbot_logger.exception("Query failed")
+            metrics.inc("query_errors_total", mode=mode)
+            return QueryResult(answer=ERROR_ANSWER, answered=False, error=repr(e))
+
+        self.__finish_query(query, course, query_embedding, generation, result)
+        return result
+
+    def perform_query(self, query: str, course: Course):
+        """
+        Run chat query
+        :param query:
+        :param course:
+        :return: answer including the sources
+        """
+        return str(self.answer(query, course))
 
-            output = response.response + self.build_sources_output(response)
+    def stream_query(self, query: str, course: Course, mode: str = None):
+        """
+        Run chat query and stream the answer while it is generated
+        :param query:
+        :param course:
+        :param mode: "agent" or "direct", defaults to the configured query mode
+        :return: generator of text chunks, the sources are the last chunk
+        """
+        mode = mode or self.query_mode
+        chatbot_logger.info(f"Performing streaming query ({mode})")
+        chatbot_logger.debug(f"Query: {query}")
+        chatbot_logger.debug(f"Course: {course}")
 
-            return output
-        except:
-            return "Diese Frage kann leider nicht beantwortet werden!"
+        start = time.perf_counter()
+        with metrics.span("query", mode=mode, streaming=True):
+            result = yield from self.__stream_answer(query, course, mode)
+        self.__log_query(query, course, mode, result, time.perf_counter() - start)
+
+    def __stream_answer(self, query: str, course: Course, mode: str):
+        """Generator of the text chunks of stream_query, returns the complete result"""
+        answer = ""
+        try:
+            query_embedding, generation, cached_result = self.__cached_answer(query, course)
+            if cached_result is not None:
+                yield str(cached_result)
+                return cached_result
+
+            if mode == "direct":
+                query_engine, query_bundle, nodes = self.__direct_retrieve(
+                    query, course, query_embedding, streaming=True)
+                if nodes is None:
+                    result = self.__unanswered(query)
+                    yield result.answer
+                    self.__finish_query(query, course, query_embedding, generation, result)
+                    return result
+                response = query_engine.synthesize(query_bundle, nodes)
+                tokens = strip_stream_answer_prefix(response.response_gen)
+            else:
+                with metrics.span("agent_create"):
+                    agent = self.__create_agent(course)
+                response = agent.stream_chat(query)
+                tokens = response.response_gen
+
+            for token in tokens:
+                answer += token
+                yield token
+            sources = self.build_sources_output(response)
+            yield sources
+
+            if mode == "direct":
+                answered = is_answered(answer)
+                if not answered:
+                    self.log_unanswered_question(query)
+            else:
+                self.__record_agent_iterations(agent)
+                answered = not any(
+                    tool_output.tool_name == "log_unanswered_question" for tool_output in response.sources)
+            result = QueryResult(answer=answer, sources=sources, answered=answered, source_nodes=response.source_nodes)
+            self.__finish_query(query, course, query_embedding, generation, result)
+            return result
+        except Exception as e:
+            chatbot_logger.exception("Streaming query failed")
+            metrics.inc("query_errors_total", mode=mode)
+            yield ("\n\n" if answer else "") + ERROR_ANSWER
+            return QueryResult(answer=answer + ERROR_ANSWER, answered=False, error=repr(e))
@@ -0,0 +1,71 @@
+import os
+
+from src.helpers.IndexManifest import SOURCES_FNAME
+
+# set by set_directories, kept apart from the ChatBot so that processes only forwarding questions do not load the models
+DATA_DIR = ""
+PERSIST_DIR = ""
+
+
+def set_directories(documents_dir: str, index_dir: str):
+    """
+    Set the directories of the courses, done by the ChatBot and by processes that only need to know the courses
+    :param documents_dir: directory with one subdirectory per course
+    :param index_dir: directory of the persisted indexes
+    :return:
+    """
+    global DATA_DIR, PERSIST_DIR
+    DATA_DIR = documents_dir
+    PERSIST_DIR = index_dir
+
+
+class CourseType(type):
+    """Iterating over Course yields the courses discovered in the documents directory"""
+
+    def __iter__(cls):
+        return iter(cls.discover())
+
+    def __len__(cls):
+        return len(cls.discover())
+
+
+class Course(object, metaclass=CourseType):
+    """
+    A course is a subdirectory of the documents directory containing a sources.json. Like an enum, Course("it") is the
+    course of that directory and raises a ValueError for unknown courses.
+    """
+
+    def __init__(self, value: str):
+        if value != os.path.basename(value) or value.startswith(".") or \
+                not os.path.isfile(os.path.join(DATA_DIR, value, SOURCES_FNAME)):
+            raise ValueError(f"{value!r} is not a valid Course")
+        self.value = value
+
+    @classmethod
+    def discover(cls) -> list:
+        """
+        Find all courses
+        :return: courses sorted by name
+        """
+        if not os.path.isdir(DATA_DIR):
+            return []
+        return [cls(name) for name in sorted(os.listdir(DATA_DIR))
+                if not name.startswith(".") and os.path.isfile(os.path.join(DATA_DIR, name, SOURCES_FNAME))]
+
+    def data_dir(self) -> str:
+        return DATA_DIR + "/" + self.value
+
+    def persist_dir(self) -> str:
+        return PERSIST_DIR + "/" + self.value
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Course) and other.value == self.value
+
+    def __hash__(self) -> int:
+        return hash(self.value)
+
+    def __str__(self) -> str:
+        return f"Course.{self.value.upper()}"
+
+    def __repr__(self) -> str:
+        return f"<Course {self.value!r}>"
@@ -0,0 +1,27 @@
+from dataclasses import dataclass, field
+
+# answer of a query that failed, e.g. because the LLM could not be reached
+ERROR_ANSWER = "Diese Frage kann leider nicht beantwortet werden!"
+
+
+@dataclass
+class QueryResult:
+    answer: str
+    sources: str = ""
+    answered: bool = True
+    cached: bool = False
+    source_nodes: list = field(default_factory=list)
+    # repr of the exception if the query failed, the answer is then ERROR_ANSWER
+    error: str = None
+
+    def __str__(self):
+        return self.answer + (self.sources or "")
+
+    def source_references(self) -> list:
+        """Distinct file and page of the source nodes, in the order of the nodes"""
+        references = []
+        for node in self.source_nodes:
+            reference = {"file": node.metadata.get("file_name"), "page": node.metadata.get("page_label")}
+            if reference not in references:
+                references.append(reference)
+        return references
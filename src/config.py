@@ -0,0 +1,62 @@
+import os
+
+# environment variables of the ChatBot, shared by the Discord bot and the workers
+DOCUMENTS_DIR = os.environ.get('DOCUMENTS_DIR') or './data/documents'
+INDEX_DIR = os.environ.get('INDEX_DIR') or './data/index'
+VECTOR_STORE_DTYPE = os.environ.get('VECTOR_STORE_DTYPE', 'float32')
+ANSWER_CACHE_THRESHOLD = float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.95))
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', 256))
+ANSWER_CACHE_TTL = float(os.environ.get('ANSWER_CACHE_TTL', 24 * 60 * 60))
+QUERY_MODE = os.environ.get('QUERY_MODE', 'agent')
+RETRIEVAL_MODE = os.environ.get('RETRIEVAL_MODE', 'hybrid')
+MIN_ANSWER_SCORE = float(os.environ.get('MIN_ANSWER_SCORE', 0.4))
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 0)) or None
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 32))
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 500000))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 1024))
+EMBED_BACKEND = os.environ.get('EMBED_BACKEND', 'torch')
+ONNX_MODEL_PATH = os.environ.get('ONNX_MODEL_PATH')
+EMBED_THREADS = int(os.environ.get('EMBED_THREADS', 0)) or None
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE')
+OLLAMA_CONTEXT_WINDOW = int(os.environ.get('OLLAMA_CONTEXT_WINDOW', 3900))
+WARM_UP = os.environ.get('WARM_UP', 'true').lower() == 'true'
+KEEP_WARM_INTERVAL = float(os.environ.get('KEEP_WARM_INTERVAL', 240))
+KEEP_WARM_HOURS = os.environ.get('KEEP_WARM_HOURS')
+INDEX_MEMORY_BUDGET_MB = float(os.environ.get('INDEX_MEMORY_BUDGET_MB', 0))
+INDEX_READ_ONLY = os.environ.get('INDEX_READ_ONLY', 'false').lower() == 'true'
+WATCH_INTERVAL = float(os.environ.get('WATCH_INTERVAL', 10))
+WATCH_DEBOUNCE = float(os.environ.get('WATCH_DEBOUNCE', 30))
+CONTEXT_PACKING = os.environ.get('CONTEXT_PACKING', 'true').lower() == 'true'
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1500))
+PRELOAD_COURSES = [course for course in os.environ.get('PRELOAD_COURSES', '').split(',') if course]
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_LOG_INTERVAL = float(os.environ.get('METRICS_LOG_INTERVAL', 300))
+
+# plain numbers are seconds, otherwise a duration like 30m
+if OLLAMA_KEEP_ALIVE and OLLAMA_KEEP_ALIVE.lstrip('-').isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+
+
+def create_chatbot(llm=None, **overrides) -> "ChatBot":
+    """
+    Create the ChatBot configured by the environment variables
+    :param llm: language model replacing Ollama, e.g. a stand-in for tests
+    :param overrides: ChatBot arguments replacing the configured ones, e.g. answer_cache_size=0
+    :return:
+    """
+    arguments = dict(documents_dir=DOCUMENTS_DIR, index_dir=INDEX_DIR, vector_dtype=VECTOR_STORE_DTYPE,
+                     answer_cache_threshold=ANSWER_CACHE_THRESHOLD, answer_cache_size=ANSWER_CACHE_SIZE,
+                     answer_cache_ttl=ANSWER_CACHE_TTL, query_mode=QUERY_MODE, min_answer_score=MIN_ANSWER_SCORE,
+                     llm=llm, ingest_workers=INGEST_WORKERS, embed_batch_size=EMBED_BATCH_SIZE,
+                     embedding_cache_size=EMBEDDING_CACHE_SIZE, query_embedding_cache_size=QUERY_EMBEDDING_CACHE_SIZE,
+                     embed_backend=EMBED_BACKEND, onnx_model_path=ONNX_MODEL_PATH, embed_threads=EMBED_THREADS,
+                     retrieval_mode=RETRIEVAL_MODE, context_window=OLLAMA_CONTEXT_WINDOW,
+                     ollama_keep_alive=OLLAMA_KEEP_ALIVE, keep_warm_interval=KEEP_WARM_INTERVAL,
+                     keep_warm_hours=KEEP_WARM_HOURS, index_memory_budget=int(INDEX_MEMORY_BUDGET_MB * 1024 * 1024),
+                     preload_courses=PRELOAD_COURSES, read_only_index=INDEX_READ_ONLY, watch_interval=WATCH_INTERVAL,
+                     watch_debounce=WATCH_DEBOUNCE, context_packing=CONTEXT_PACKING,
+                     context_token_budget=CONTEXT_TOKEN_BUDGET)
+    arguments.update(overrides)
+    # imported here, the Discord bot forwarding questions to workers only needs the settings and not the models
+    from src.ChatBot import ChatBot
+    return ChatBot(**arguments)
@@ -1,25 +1,47 @@
+import asyncio
 import discord
 import functools
 import logging
+from typing import TYPE_CHECKING
 
 from discord import Message
 from discord.ext import commands
-from src.ChatBot import ChatBot, Course
+from src.Course import Course
 from src.discord.Dropdowns import DropdownView
+from src.discord.QueryScheduler import (QueryScheduler, SchedulerOverloaded,
+                                        UserLimitReached)
+from src.discord.SessionStore import Session, SessionStore
+from src.discord.StreamingMessage import StreamingMessage
 from src.discord.disclaimer import disclaimer
+from src.metrics import metrics
+
+if TYPE_CHECKING:
+    # the bot may forward the questions to workers (RemoteChatBot) and then does not load the ChatBot with its models
+    from src.ChatBot import ChatBot
 
 chatbot_logger = logging.getLogger('ChatBot')
 
+USER_LIMIT_MESSAGE = 'Deine vorherige Frage wird noch bearbeitet. Bitte warte auf die Antwort, bevor du weitere Fragen stellst.'
+OVERLOADED_MESSAGE = 'Aktuell sind sehr viele Fragen offen. Bitte versuche es in ein paar Minuten erneut.'
+PLACEHOLDER_MESSAGE = 'Einen Moment, ich suche nach einer Antwort …'
+
 
 class DiscordBot(commands.Bot):
-    chatbot: ChatBot = None
+    chatbot: "ChatBot" = None
+    scheduler: QueryScheduler = None
+    sessions: SessionStore = None
 
-    def __init__(self, documents_dir: str, index_dir: str):
+    def __init__(self, chatbot: "ChatBot", scheduler: QueryScheduler = None, stream_responses: bool = False,
+                 sessions: SessionStore = None):
         intents = discord.Intents.default()
         intents.message_content = True
         super().__init__(command_prefix=commands.when_mentioned_or('$'), intents=intents)
-        self.chatbot = ChatBot(
-            documents_dir=documents_dir, index_dir=index_dir)
+        self.chatbot = chatbot
+        self.scheduler = scheduler or QueryScheduler()
+        # edit the answer while it is generated instead of sending it when complete
+        self.stream_responses = stream_responses
+        # course selection and disclaimer state, pinned messages are only read for unknown channels
+        self.sessions = sessions or SessionStore()
 
     async def on_ready(self):
         print(f'Logged in as {self.user} (ID: {self.user.id})')
@@ -34,27 +56,107 @@ class DiscordBot(commands.Bot):
         if not isinstance(message.channel, discord.channel.DMChannel):
             return
 
-        # get pinned messages
-        pinned_messages = await message.channel.pins()
+        with metrics.span("discord_message"):
+            await self.answer_message(message)
 
-        course: Course = None
-        disclaimer_present = False
-        # check if course is pinned
-        for msg in pinned_messages:
-            if msg.content.startswith('Kurs:') and msg.author.id == self.user.id:
-                course = Course(msg.content.split(': ')[1].lower())
-            if msg.content.startswith("## **Disclaimer:**"):
-                disclaimer_present = True
+    async def answer_message(self, message: Message):
+        """
+        Show the disclaimer and the course selection if needed, otherwise answer the question
+        :param message: DM of a user
+        :return:
+        """
+        session = self.sessions.get(message.channel.id)
+        if session is None:
+            session = await self.load_session(message.channel)
 
-        if not disclaimer_present:
+        if not session.disclaimer_shown:
             msg = await message.channel.send(disclaimer)
             await msg.pin()
+            self.sessions.set_disclaimer_shown(message.channel.id)
+
+        course: Course = None
+        if session.course:
+            try:
+                course = Course(session.course)
+            except ValueError:
+                # the course was removed from the documents directory, let the user choose again
+                chatbot_logger.warning(f"Unknown course {session.course} in session of channel {message.channel.id}")
 
         if course is None:
             view = DropdownView()
             await message.channel.send('Bitte wähle deinen Kurs und stelle die Frage anschließend erneut', view=view)
+        elif self.stream_responses:
+            await self.answer_streaming(message, course)
         else:
             fun = functools.partial(
                 self.chatbot.perform_query, message.content, course)
-            response = await self.loop.run_in_executor(None, fun)
-            await message.channel.send(response)
+            try:
+                response = await self.scheduler.submit(
+                    message.author.id, fun, on_queued=functools.partial(self.send_queue_position, message.channel))
+            except UserLimitReached:
+                response = USER_LIMIT_MESSAGE
+            except SchedulerOverloaded:
+                response = OVERLOADED_MESSAGE
+            with metrics.span("discord_send"):
+                await message.channel.send(response)
+
+    async def load_session(self, channel) -> Session:
+        """
+        Recover course and disclaimer state of a channel from its pinned messages
+        :param channel:
+        :return:
+        """
+        with metrics.span("discord_pins"):
+            pinned_messages = await channel.pins()
+
+        course = None
+        disclaimer_present = False
+        # check if course is pinned
+        for msg in pinned_messages:
+            if msg.content.startswith('Kurs:') and msg.author.id == self.user.id:
+                course = msg.content.split(': ')[1].lower()
+            if msg.content.startswith("## **Disclaimer:**"):
+                disclaimer_present = True
+
+        session = Session(course=course, disclaimer_shown=disclaimer_present)
+        self.sessions.put(channel.id, session)
+        return session
+
+    async def answer_streaming(self, message: Message, course: Course):
+        """
+        Answer a question with a message that is edited while the answer is generated
+        :param message: the question
+        :param course:
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def produce():
+            # runs on a worker thread of the scheduler
+            loop.call_soon_threadsafe(chunks.put_nowait, "")
+            try:
+                for chunk in self.chatbot.stream_query(message.content, course):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+        async def consume():
+            # the placeholder is posted with the first (empty) chunk, once the question is being answered
+            streaming_message = StreamingMessage(message.channel, placeholder=PLACEHOLDER_MESSAGE)
+            while (chunk := await chunks.get()) is not None:
+                await streaming_message.append(chunk)
+            await streaming_message.close()
+
+        consumer = asyncio.create_task(consume())
+        try:
+            await self.scheduler.submit(
+                message.author.id, produce, on_queued=functools.partial(self.send_queue_position, message.channel))
+        except (UserLimitReached, SchedulerOverloaded) as e:
+            consumer.cancel()
+            await message.channel.send(USER_LIMIT_MESSAGE if isinstance(e, UserLimitReached) else OVERLOADED_MESSAGE)
+            return
+        await consumer
+
+    async def send_queue_position(self, channel, position: int):
+        await channel.send(f'Deine Frage ist in der Warteschlange (Position {position}). Die Antwort folgt so bald wie möglich.')
@@ -1,15 +1,25 @@
+import logging
+
 import discord
 
-import src.ChatBot
+import src.Course
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# Discord allows at most 25 options per dropdown
+MAX_OPTIONS = 25
 
 
 class Dropdown(discord.ui.Select):
     def __init__(self):
 
-        # Set the options that will be presented inside the dropdown
+        # Set the options that will be presented inside the dropdown, one per course found in the documents directory
         options = []
 
-        for course in src.ChatBot.Course:
+        courses = list(src.Course.Course)
+        if len(courses) > MAX_OPTIONS:
+            chatbot_logger.warning(f"{len(courses)} courses found, only the first {MAX_OPTIONS} can be selected")
+        for course in courses[:MAX_OPTIONS]:
             options.append(discord.SelectOption(
                 label=course.value, description=course.value))
 
@@ -21,6 +31,7 @@ class Dropdown(discord.ui.Select):
         # Sends a message with the course that was selected
         await interaction.response.send_message(f'Kurs: {self.values[0]}')
         message = await interaction.original_response()
+        interaction.client.sessions.set_course(message.channel.id, self.values[0])
         # remove old pinned messages to avoid clutter
         pinned_messages = await message.channel.pins()
         for msg in pinned_messages:
@@ -0,0 +1,74 @@
+import itertools
+import time
+from dataclasses import dataclass
+
+import discord
+
+_message_ids = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class FakeUser:
+    id: int
+    name: str = "student"
+
+
+class FakeMessage(object):
+    """Message of a FakeDMChannel with the parts of discord.Message used by the bot"""
+
+    def __init__(self, content: str, author: FakeUser, channel: "FakeDMChannel"):
+        self.id = next(_message_ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.pinned = False
+        # perf_counter of the creation and of every edit
+        self.created_at = time.perf_counter()
+        self.edited_at = []
+
+    async def pin(self, **kwargs):
+        self.pinned = True
+        if self not in self.channel.pinned:
+            self.channel.pinned.append(self)
+
+    async def unpin(self, **kwargs):
+        self.pinned = False
+        if self in self.channel.pinned:
+            self.channel.pinned.remove(self)
+
+    async def edit(self, content: str = None, **kwargs) -> "FakeMessage":
+        if content is not None:
+            self.content = content
+        self.edited_at.append(time.perf_counter())
+        return self
+
+
+class FakeDMChannel(discord.DMChannel):
+    """
+    DM channel without a Discord connection for load tests: messages sent by the bot are recorded in sent and pinned
+    messages are kept in memory. Derives from discord.DMChannel so the bot treats it as a DM.
+    """
+
+    def __init__(self, channel_id: int, recipient: FakeUser, me: FakeUser):
+        # the base class expects the state of a gateway connection, only the attributes used by the bot are set
+        self.id = channel_id
+        self.recipients = [recipient]
+        self.me = me
+        self._state = None
+        self.sent = []
+        self.pinned = []
+
+    def message(self, content: str) -> FakeMessage:
+        """Message of the recipient in this channel, as passed to on_message"""
+        return FakeMessage(content, self.recipient, self)
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        message = FakeMessage(content or "", self.me, self)
+        self.sent.append(message)
+        return message
+
+    async def pins(self) -> list:
+        return list(self.pinned)
+
+    def __repr__(self) -> str:
+        return f"<FakeDMChannel id={self.id} recipient={self.recipient.name}>"
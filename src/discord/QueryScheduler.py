@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the queue of the scheduler is full"""
+
+
+class UserLimitReached(Exception):
+    """Raised when a user already has the maximal number of questions pending"""
+
+
+class QueryScheduler(object):
+    """
+    Runs chatbot queries on a dedicated thread pool with a fixed number of concurrent queries. Waiting queries are
+    served first come, first served, but each user has at most one query running or waiting in the shared queue at a
+    time; further questions of the same user wait until the previous one is answered.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue_size: int = 20, max_pending_per_user: int = 2):
+        """
+        :param max_concurrency: queries answered at the same time, should match what the LLM backend can serve
+        :param max_queue_size: queries waiting in the shared queue at most, further queries are rejected; further
+            questions of a user waiting for the previous one are not counted
+        :param max_pending_per_user: queries of one user running or waiting at most
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_pending_per_user = max_pending_per_user
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="query")
+        self._running = 0
+        self._waiting = deque()
+        self._user_pending = {}
+        self._user_locks = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of queries running or waiting"""
+        return sum(self._user_pending.values())
+
+    @property
+    def queued(self) -> int:
+        """Number of queries waiting for a worker in the shared queue, without further questions of the same users"""
+        return len(self._waiting)
+
+    async def submit(self, user_id, fn, on_queued=None):
+        """
+        Run a query as soon as a worker is free
+        :param user_id: user asking the question
+        :param fn: blocking function running the query
+        :param on_queued: coroutine function called with the queue position if the query has to wait
+        :return: result of fn
+        """
+        if self._user_pending.get(user_id, 0) >= self.max_pending_per_user:
+            metrics.inc("queries_rejected_total", reason="user_limit")
+            raise UserLimitReached()
+        if self._running >= self.max_concurrency and self.queued >= self.max_queue_size:
+            chatbot_logger.warning(f"Query scheduler overloaded, rejecting query ({self.queued} queued)")
+            metrics.inc("queries_rejected_total", reason="overloaded")
+            raise SchedulerOverloaded()
+
+        self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        metrics.set("queries_pending", self.pending)
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        try:
+            # one question per user in the shared queue
+            async with lock:
+                queued = time.perf_counter()
+                await self.__acquire(on_queued)
+                metrics.observe("stage_seconds", time.perf_counter() - queued, stage="queue_wait")
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self._executor, fn)
+                finally:
+                    self.__release()
+        finally:
+            self._user_pending[user_id] -= 1
+            if self._user_pending[user_id] == 0:
+                del self._user_pending[user_id]
+                del self._user_locks[user_id]
+            metrics.set("queries_pending", self.pending)
+
+    async def __acquire(self, on_queued):
+        if self._running < self.max_concurrency and not self._waiting:
+            self._running += 1
+            return
+
+        slot = asyncio.get_running_loop().create_future()
+        self._waiting.append(slot)
+        chatbot_logger.debug(f"Query queued at position {len(self._waiting)}")
+        try:
+            if on_queued is not None:
+                await on_queued(len(self._waiting))
+            # the slot of a finished query is handed over by __release
+            await slot
+        except asyncio.CancelledError:
+            if slot in self._waiting:
+                self._waiting.remove(slot)
+            elif slot.done() and not slot.cancelled():
+                self.__release()
+            raise
+
+    def __release(self):
+        while self._waiting:
+            slot = self._waiting.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self._running -= 1
@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, replace
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Session:
+    course: Optional[str] = None
+    disclaimer_shown: bool = False
+
+
+class SessionStore(object):
+    """
+    Course selection and disclaimer state per DM channel, kept in memory and optionally persisted to a SQLite file so
+    the state survives restarts without reading the pinned messages again.
+    """
+
+    def __init__(self, database: str = None):
+        """
+        :param database: path of the SQLite file, None keeps the sessions in memory only
+        """
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._connection = None
+
+        if database:
+            if os.path.dirname(database):
+                os.makedirs(os.path.dirname(database), exist_ok=True)
+            self._connection = sqlite3.connect(database, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(channel_id INTEGER PRIMARY KEY, course TEXT, disclaimer_shown INTEGER NOT NULL)")
+            for channel_id, course, disclaimer_shown in self._connection.execute(
+                    "SELECT channel_id, course, disclaimer_shown FROM sessions"):
+                self._sessions[channel_id] = Session(course, bool(disclaimer_shown))
+
+    def get(self, channel_id: int) -> Optional[Session]:
+        """
+        Get the session of a channel
+        :param channel_id:
+        :return: the session or None if the channel is unknown
+        """
+        with self._lock:
+            return self._sessions.get(channel_id)
+
+    def put(self, channel_id: int, session: Session):
+        with self._lock:
+            self._sessions[channel_id] = session
+            if self._connection is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sessions (channel_id, course, disclaimer_shown) VALUES (?, ?, ?)",
+                    (channel_id, session.course, int(session.disclaimer_shown)))
+                self._connection.commit()
+
+    def set_course(self, channel_id: int, course: str):
+        self.put(channel_id, replace(self.get(channel_id) or Session(), course=course))
+
+    def set_disclaimer_shown(self, channel_id: int):
+        self.put(channel_id, replace(self.get(channel_id) or Session(), disclaimer_shown=True))
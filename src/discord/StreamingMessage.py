@@ -0,0 +1,76 @@
+import time
+
+from discord.abc import Messageable
+
+# maximal length of a Discord message
+MESSAGE_LIMIT = 2000
+
+
+class StreamingMessage(object):
+    """
+    Discord answer that grows while it is generated. A placeholder is posted first and edited with the text received
+    so far, at most once per edit interval to respect Discord's rate limits. Text exceeding the message limit is
+    continued in further messages.
+    """
+
+    def __init__(self, channel: Messageable, placeholder: str = "…", edit_interval: float = 1.5):
+        """
+        :param channel: channel to answer in
+        :param placeholder: content of the message until the first text arrives
+        :param edit_interval: minimal seconds between two edits
+        """
+        self.channel = channel
+        self.placeholder = placeholder
+        self.edit_interval = edit_interval
+        self.text = ""
+        self._messages = []
+        self._last_edit = 0.0
+
+    async def start(self):
+        """Post the placeholder message"""
+        if not self._messages:
+            self._messages.append(await self.channel.send(self.placeholder))
+            self._last_edit = time.monotonic()
+
+    async def append(self, text: str):
+        """
+        Add text, the messages are updated if the edit interval passed
+        :param text:
+        :return:
+        """
+        self.text += text
+        if time.monotonic() - self._last_edit >= self.edit_interval:
+            await self.flush()
+
+    async def close(self):
+        """Show the complete text"""
+        await self.flush()
+
+    async def flush(self):
+        await self.start()
+        for position, page in enumerate(self.pages(self.text or self.placeholder)):
+            if position < len(self._messages):
+                if self._messages[position].content != page:
+                    self._messages[position] = await self._messages[position].edit(content=page)
+            else:
+                self._messages.append(await self.channel.send(page))
+        self._last_edit = time.monotonic()
+
+    @staticmethod
+    def pages(text: str) -> list:
+        """
+        Split text into message sized pages, preferably at line breaks or spaces. Pages that are full do not change when
+        more text is appended.
+        :param text:
+        :return:
+        """
+        pages = []
+        while len(text) > MESSAGE_LIMIT:
+            cut = max(text.rfind("\n", 0, MESSAGE_LIMIT), text.rfind(" ", 0, MESSAGE_LIMIT))
+            if cut <= 0:
+                cut = MESSAGE_LIMIT
+            pages.append(text[:cut])
+            text = text[cut:].lstrip(" ")
+        if text or not pages:
+            pages.append(text)
+        return pages
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+@dataclass
+class CachedAnswer:
+    embedding: np.ndarray
+    answer: object
+    created: float
+
+
+class AnswerCache(object):
+    """
+    Per-course cache of answers, looked up by cosine similarity of the query embedding. Entries are evicted least
+    recently used first and expire after a fixed time. Invalidating a course starts a new generation of it, answers of
+    queries started in an older generation are not cached anymore.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, ttl: float = 24 * 60 * 60):
+        """
+        :param threshold: minimal cosine similarity of two queries to share an answer
+        :param max_entries: maximal number of answers per course, 0 disables the cache
+        :param ttl: seconds until an answer expires
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._courses = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, course, embedding: List[float]):
+        """
+        Get the answer of the most similar cached query
+        :param course:
+        :param embedding: query embedding
+        :return: the cached answer or None
+        """
+        if self.max_entries <= 0:
+            return None
+        query = self._normalize(embedding)
+
+        with self._lock:
+            entries = self._courses.get(course, OrderedDict())
+            expired = [key for key, entry in entries.items() if time.time() - entry.created > self.ttl]
+            for key in expired:
+                del entries[key]
+
+            best_key, best_similarity = None, self.threshold
+            for key, entry in entries.items():
+                similarity = float(entry.embedding @ query)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                metrics.inc("answer_cache_misses_total")
+                answer = None
+            else:
+                self.hits += 1
+                metrics.inc("answer_cache_hits_total")
+                entries.move_to_end(best_key)
+                answer = entries[best_key].answer
+            hits, misses = self.hits, self.misses
+
+        chatbot_logger.info(
+            f"Answer cache {'hit' if answer is not None else 'miss'} for course {course} (hits: {hits}, misses: {misses})")
+        return answer
+
+    def generation(self, course) -> int:
+        """
+        Current generation of a course, to be passed to put by queries started now
+        :param course:
+        :return:
+        """
+        with self._lock:
+            return self._generations.get(course, 0)
+
+    def put(self, course, embedding: List[float], answer, generation: int = None):
+        """
+        Cache an answer
+        :param course:
+        :param embedding: query embedding
+        :param answer:
+        :param generation: generation of the course when the query started, the answer is dropped if the course was
+            invalidated since then
+        :return:
+        """
+        if self.max_entries <= 0:
+            return
+        entry = CachedAnswer(self._normalize(embedding), answer, time.time())
+        key = entry.embedding.tobytes()
+
+        with self._lock:
+            if generation is not None and generation != self._generations.get(course, 0):
+                chatbot_logger.debug(f"Answer of an outdated index of course {course} not cached")
+                return
+            entries = self._courses.setdefault(course, OrderedDict())
+            entries[key] = entry
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, course):
+        """
+        Drop all answers of a course, e.g. because its documents changed
+        :param course:
+        :return:
+        """
+        with self._lock:
+            dropped = len(self._courses.pop(course, {}))
+            self._generations[course] = self._generations.get(course, 0) + 1
+        if dropped:
+            chatbot_logger.info(f"Answer cache invalidated for course {course} ({dropped} answers dropped)")
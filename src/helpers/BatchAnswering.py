@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llama_index.core import Settings
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# line of temp/unanswered_questions.log written by ChatBot.log_unanswered_question
+UNANSWERED_PATTERN = re.compile(r"Could not answer following question: (.*)$")
+
+
+def load_batch(path: str, default_course: str = None) -> list:
+    """
+    Load the questions of a batch, one JSON object per line:
+    {"id": "faq-1", "question": "...", "course": "it"}
+    "id" defaults to the line number, "course" to default_course; "query" is accepted instead of "question".
+    The unanswered questions log (*.log) can be used as well, with default_course as course of all questions.
+    :param path:
+    :param default_course:
+    :return: items with id, question and course
+    """
+    items = []
+    with open(path, encoding="utf-8") as batch_file:
+        for number, line in enumerate(batch_file, start=1):
+            if path.endswith(".log"):
+                match = UNANSWERED_PATTERN.search(line.rstrip("\n"))
+                entry = {"question": match.group(1)} if match else None
+            else:
+                entry = json.loads(line) if line.strip() else None
+            if entry is None:
+                continue
+            course = entry.get("course", default_course)
+            if not course:
+                raise ValueError(f"{path}:{number}: no course, pass a default course")
+            items.append({"id": str(entry.get("id", number)), "question": entry.get("question", entry.get("query")),
+                          "course": course.lower()})
+    return items
+
+
+def completed_ids(output: str) -> set:
+    """Ids of the items answered in an output file of a previous run, failed items are tried again"""
+    ids = set()
+    if not os.path.exists(output):
+        return ids
+    with open(output, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # last line of an interrupted run
+                continue
+            if "error" not in record:
+                ids.add(record["id"])
+    return ids
+
+
+def run_batch(chat_bot, course_type, items: list, output: str, parallelism: int = 1, batch_size: int = 32,
+              mode: str = None) -> dict:
+    """
+    Answer the items and append one JSON line per answer to the output file as soon as it is available. Items already
+    in the output file are skipped, so an interrupted run continues where it stopped.
+    :param chat_bot:
+    :param course_type: Course class, used to resolve the course of an item
+    :param items: items of load_batch
+    :param output: JSONL file with id, course, question, answer, sources, answered, cached and latency per line
+    :param parallelism: questions answered at the same time, should match what the Ollama server serves in parallel
+    :param batch_size: questions embedded together before they are answered
+    :param mode: "agent" or "direct", defaults to the query mode of the ChatBot
+    :return: statistics of the run
+    """
+    done = completed_ids(output)
+    todo = [item for item in items if item["id"] not in done]
+    chatbot_logger.info(f"Batch: {len(items)} questions, {len(items) - len(todo)} already answered")
+
+    def answer(item: dict) -> dict:
+        start = time.perf_counter()
+        try:
+            result = chat_bot.answer(item["question"], course_type(item["course"]), mode)
+        except Exception as e:
+            chatbot_logger.exception(f"Batch question {item['id']} failed")
+            return {**item, "error": repr(e), "latency": round(time.perf_counter() - start, 3)}
+        if result.error is not None:
+            # the ChatBot answers failed queries with an error answer instead of raising
+            chatbot_logger.error(f"Batch question {item['id']} failed: {result.error}")
+            return {**item, "error": result.error, "latency": round(time.perf_counter() - start, 3)}
+        return {**item, "answer": result.answer, "sources": result.source_references(), "answered": result.answered,
+                "cached": result.cached, "latency": round(time.perf_counter() - start, 3)}
+
+    stats = {"answered": 0, "unanswered": 0, "errors": 0, "latencies": []}
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "a", encoding="utf-8") as output_file, ThreadPoolExecutor(parallelism) as executor:
+
+        def write(futures):
+            for future in futures:
+                record = future.result()
+                output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output_file.flush()
+                if "error" in record:
+                    stats["errors"] += 1
+                else:
+                    stats["answered" if record["answered"] else "unanswered"] += 1
+                    stats["latencies"].append(record["latency"])
+            finished = stats["answered"] + stats["unanswered"] + stats["errors"]
+            chatbot_logger.info(f"Batch: {finished}/{len(todo)} questions done")
+
+        pending = set()
+        for batch_start in range(0, len(todo), batch_size):
+            batch = todo[batch_start:batch_start + batch_size]
+            if hasattr(Settings.embed_model, "get_query_embedding_batch"):
+                # fills the query cache, the questions are then looked up instead of embedded one by one
+                with metrics.span("embed_query_batch"):
+                    Settings.embed_model.get_query_embedding_batch([item["question"] for item in batch])
+            for item in batch:
+                # keep the pool busy without queueing all questions at once
+                if len(pending) >= 2 * parallelism:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    write(finished)
+                pending.add(executor.submit(answer, item))
+        write(wait(pending).done)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
@@ -0,0 +1,160 @@
+import json
+import statistics
+import time
+
+from llama_index.core import Settings
+from llama_index.core.schema import QueryBundle
+
+from src.helpers.ContextPacker import count_tokens
+from src.helpers.IndexManifest import document_file_name
+
+STAGES = ("embed", "retrieve", "postprocess", "pack", "synthesize", "query")
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Nearest-rank percentile
+    :param values:
+    :param percent: 0-100
+    :return:
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def load_questions(path: str) -> list:
+    """
+    Load benchmark questions, one JSON object per line:
+    {"question": "...", "course": "it", "expected": [{"file": "FAQ.txt", "page": "2"}]}
+    "page" is optional, without it every page of the file counts as relevant.
+    :param path:
+    :return:
+    """
+    with open(path, encoding="utf-8") as questions_file:
+        return [json.loads(line) for line in questions_file if line.strip()]
+
+
+def is_relevant(node, expected: dict) -> bool:
+    if document_file_name(node.metadata.get("file_path", "")) != expected["file"]:
+        return False
+    return "page" not in expected or str(node.metadata.get("page_label")) == str(expected["page"])
+
+
+def ranking_metrics(nodes: list, expected: list, ks: list) -> dict:
+    """
+    Recall@k and reciprocal rank of a ranked node list
+    :param nodes: retrieved nodes, best first
+    :param expected: expected sources
+    :param ks: cutoffs for recall
+    :return:
+    """
+    metrics = {}
+    for k in ks:
+        found = [item for item in expected if any(is_relevant(node, item) for node in nodes[:k])]
+        metrics[f"recall@{k}"] = len(found) / len(expected) if expected else 1.0
+
+    metrics["rr"] = 0.0
+    for rank, node in enumerate(nodes, start=1):
+        if any(is_relevant(node, item) for item in expected):
+            metrics["rr"] = 1 / rank
+            break
+    return metrics
+
+
+def run_benchmark(chat_bot, course_type, questions: list, ks: list, full: bool = False) -> dict:
+    """
+    Run retrieval, and optionally synthesis and the complete query, for every question and time each stage
+    :param chat_bot: ChatBot with loaded indexes
+    :param course_type: Course class, used to resolve the course of a question
+    :param questions: benchmark questions
+    :param ks: cutoffs for recall, the largest one is the number of retrieved nodes
+    :param full: also run synthesis and perform the complete query
+    :return: per question results and summary
+    """
+    retrievers = {}
+    # rankings are measured before the context is packed for the LLM
+    postprocessors = chat_bot.node_postprocessors(pack_context=False)
+    results = []
+
+    for question in questions:
+        course = course_type(question["course"].lower())
+        if course not in retrievers:
+            retrievers[course] = chat_bot.build_retriever(chat_bot.engine(course).index, similarity_top_k=max(ks))
+        timings = {}
+
+        start = time.perf_counter()
+        embedding = Settings.embed_model.get_query_embedding(question["question"])
+        timings["embed"] = time.perf_counter() - start
+
+        query_bundle = QueryBundle(question["question"], embedding=embedding)
+        start = time.perf_counter()
+        nodes = retrievers[course].retrieve(query_bundle)
+        timings["retrieve"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for postprocessor in postprocessors:
+            nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        timings["postprocess"] = time.perf_counter() - start
+
+        result = {
+            "question": question["question"],
+            "course": course.value,
+            "retrieved": [
+                {"file": document_file_name(node.metadata.get("file_path", "")),
+                 "page": node.metadata.get("page_label"), "score": node.score}
+                for node in nodes
+            ],
+            **ranking_metrics(nodes, question.get("expected", []), ks),
+        }
+
+        if full:
+            direct_engine = chat_bot.engine(course).direct_engine
+            context = nodes[:3]
+            if chat_bot.context_packer is not None:
+                start = time.perf_counter()
+                context = chat_bot.context_packer.postprocess_nodes(context, query_bundle=query_bundle)
+                timings["pack"] = time.perf_counter() - start
+            result["context_tokens"] = {"retrieved": count_tokens(nodes[:3]), "packed": count_tokens(context)}
+
+            start = time.perf_counter()
+            direct_engine.synthesize(query_bundle, context)
+            timings["synthesize"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            query_result = chat_bot.answer(question["question"], course)
+            timings["query"] = time.perf_counter() - start
+            result["answer"] = str(query_result)
+            result["answered"] = query_result.answered
+
+        result["timings"] = timings
+        results.append(result)
+
+    return {"results": results, "summary": summarize(results, ks)}
+
+
+def summarize(results: list, ks: list) -> dict:
+    """
+    Mean ranking metrics and latency percentiles per stage
+    :param results: per question results of run_benchmark
+    :param ks:
+    :return:
+    """
+    if not results:
+        return {}
+    summary = {f"recall@{k}": statistics.mean(result[f"recall@{k}"] for result in results) for k in ks}
+    summary["mrr"] = statistics.mean(result["rr"] for result in results)
+    context_tokens = [result["context_tokens"] for result in results if "context_tokens" in result]
+    if context_tokens:
+        summary["context_tokens_retrieved"] = statistics.mean(tokens["retrieved"] for tokens in context_tokens)
+        summary["context_tokens_packed"] = statistics.mean(tokens["packed"] for tokens in context_tokens)
+    summary["latency"] = {}
+    for stage in STAGES:
+        values = [result["timings"][stage] for result in results if stage in result["timings"]]
+        if values:
+            summary["latency"][stage] = {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "mean": statistics.mean(values),
+            }
+    return summary
@@ -0,0 +1,207 @@
+import logging
+from typing import List, Optional
+
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import (MetadataMode, NodeWithScore, QueryBundle,
+                                     TextNode)
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# lines of this length repeated in a better node are dropped, e.g. page headers and footers
+BOILERPLATE_LINE_LENGTH = (20, 200)
+
+
+def node_text(node: NodeWithScore) -> str:
+    """Text of a node as the citation query engine puts it into the prompt"""
+    return node.node.get_content(metadata_mode=MetadataMode.NONE)
+
+
+def count_tokens(nodes: List[NodeWithScore]) -> int:
+    """Tokens of the texts of nodes, counted with the tokenizer of the llama-index settings"""
+    return sum(len(Settings.tokenizer(node_text(node))) for node in nodes)
+
+
+def text_overlap(first: str, second: str, min_overlap: int) -> int:
+    """
+    Length of the longest end of first that is also the beginning of second
+    :param first:
+    :param second:
+    :param min_overlap: shorter overlaps are not searched for
+    :return: characters, 0 if there is no overlap of at least min_overlap
+    """
+    head = second[:min_overlap]
+    if len(head) < min_overlap:
+        return 0
+    start = first.find(head, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(head, start + 1)
+    return 0
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Packs the retrieved nodes into a smaller context for the LLM, best nodes first: overlapping and adjacent chunks of
+    the same page are merged, repeated text is dropped and the nodes are cut to a token budget. File name, page and
+    link of the sources are kept, merged chunks always come from the same page.
+    """
+
+    token_budget: int = Field(default=1500, description="tokens of all node texts at most, 0 for no limit")
+    min_overlap: int = Field(default=32, description="characters two chunks have to share to be merged")
+    min_tokens: int = Field(default=64, description="a node is only cut to the budget if this many tokens remain")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        with metrics.span("context_packing"):
+            retrieved_tokens = count_tokens(nodes)
+            packed = self.__fit_budget(self.__drop_repeated(self.__merge(nodes)))
+            packed_tokens = count_tokens(packed)
+
+        metrics.inc("context_tokens_total", retrieved_tokens, stage="retrieved")
+        metrics.inc("context_tokens_total", packed_tokens, stage="packed")
+        chatbot_logger.debug(f"Context packed from {len(nodes)} nodes with {retrieved_tokens} tokens "
+                             f"to {len(packed)} nodes with {packed_tokens} tokens")
+        return packed
+
+    def __merge(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Merge chunks of the same page that overlap, contain each other or are adjacent in the document"""
+        pages = {}
+        for node in nodes:
+            key = (node.node.metadata.get("file_name"), node.node.metadata.get("page_label"))
+            pieces = pages.setdefault(key, [])
+            pieces.append(node)
+            # merging two pieces can make a third one overlap
+            merged = True
+            while merged and len(pieces) > 1:
+                merged = self.__merge_last(pieces)
+
+        # pages in the order of their best node
+        packed = [piece for pieces in pages.values() for piece in pieces]
+        return sorted(packed, key=lambda piece: piece.score or 0, reverse=True)
+
+    def __merge_last(self, pieces: List[NodeWithScore]) -> bool:
+        last = pieces[-1]
+        for position, piece in enumerate(pieces[:-1]):
+            text = self.__merged_text(piece, last)
+            if text is not None:
+                best = piece if (piece.score or 0) >= (last.score or 0) else last
+                merged = _with_text(best, text, max(piece.score or 0, last.score or 0))
+                if _same_document(piece, last):
+                    merged.node.start_char_idx = min(piece.node.start_char_idx, last.node.start_char_idx)
+                    merged.node.end_char_idx = max(piece.node.end_char_idx, last.node.end_char_idx)
+                pieces[position] = merged
+                del pieces[-1]
+                pieces.append(pieces.pop(position))
+                return True
+        return False
+
+    def __merged_text(self, first: NodeWithScore, second: NodeWithScore) -> Optional[str]:
+        first_text, second_text = node_text(first), node_text(second)
+        if second_text in first_text:
+            return first_text
+        if first_text in second_text:
+            return second_text
+        if _adjacent(first, second):
+            return first_text + "\n" + second_text
+        if _adjacent(second, first):
+            return second_text + "\n" + first_text
+        overlap = text_overlap(first_text, second_text, self.min_overlap)
+        if overlap:
+            return first_text + second_text[overlap:]
+        overlap = text_overlap(second_text, first_text, self.min_overlap)
+        if overlap:
+            return second_text + first_text[overlap:]
+        return None
+
+    @staticmethod
+    def __drop_repeated(nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Drop nodes whose text is already in a better node and lines repeated from better nodes"""
+        seen_texts, seen_lines = set(), set()
+        packed = []
+        for node in nodes:
+            text = node_text(node)
+            normalized = " ".join(text.split())
+            if normalized in seen_texts:
+                continue
+            seen_texts.add(normalized)
+
+            lines = []
+            for line in text.split("\n"):
+                key = " ".join(line.split())
+                if BOILERPLATE_LINE_LENGTH[0] <= len(key) <= BOILERPLATE_LINE_LENGTH[1]:
+                    if key in seen_lines:
+                        continue
+                    seen_lines.add(key)
+                lines.append(line)
+            if len(lines) < len(text.split("\n")):
+                if not "".join(lines).strip():
+                    continue
+                node = _with_text(node, "\n".join(lines), node.score)
+            packed.append(node)
+        return packed
+
+    def __fit_budget(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Keep the best nodes within the token budget, the first node exceeding it is cut"""
+        if self.token_budget <= 0:
+            return nodes
+        packed = []
+        remaining = self.token_budget
+        for node in nodes:
+            tokens = count_tokens([node])
+            if tokens <= remaining:
+                packed.append(node)
+                remaining -= tokens
+            elif remaining >= self.min_tokens:
+                node = _cut(node, remaining)
+                packed.append(node)
+                remaining -= count_tokens([node])
+        return packed
+
+
+def _same_document(first: NodeWithScore, second: NodeWithScore) -> bool:
+    """Whether both nodes are chunks of the same document with known positions"""
+    return first.node.ref_doc_id is not None and first.node.ref_doc_id == second.node.ref_doc_id and None not in (
+        first.node.start_char_idx, first.node.end_char_idx, second.node.start_char_idx, second.node.end_char_idx)
+
+
+def _adjacent(first: NodeWithScore, second: NodeWithScore) -> bool:
+    """Whether second directly follows first in the same document"""
+    return _same_document(first, second) and 0 <= second.node.start_char_idx - first.node.end_char_idx <= 1
+
+
+def _cut(node: NodeWithScore, max_tokens: int) -> NodeWithScore:
+    """Shorten the text of a node to at most max_tokens tokens, at the end of a sentence if possible"""
+    text = node_text(node)
+    while text and len(Settings.tokenizer(text)) > max_tokens:
+        text = text[:int(len(text) * 0.9)]
+        sentence_end = max(text.rfind(". "), text.rfind("\n"))
+        if sentence_end > len(text) // 2:
+            text = text[:sentence_end + 1]
+    return _with_text(node, text.rstrip(), node.score)
+
+
+def _with_text(node: NodeWithScore, text: str, score: Optional[float]) -> NodeWithScore:
+    """Copy of a node with another text, retrieved nodes are shared with the index and must not be changed"""
+    source = node.node
+    copy = TextNode(
+        id_=source.node_id,
+        text=text,
+        metadata=dict(source.metadata),
+        excluded_embed_metadata_keys=list(source.excluded_embed_metadata_keys),
+        excluded_llm_metadata_keys=list(source.excluded_llm_metadata_keys),
+        relationships=dict(source.relationships),
+        start_char_idx=source.start_char_idx,
+        end_char_idx=source.end_char_idx,
+    )
+    return NodeWithScore(node=copy, score=score)
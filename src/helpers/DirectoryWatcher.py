@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+def snapshot(directory: str) -> dict:
+    """
+    Modification time and size of every file below a directory, hidden files and directories are ignored
+    :param directory:
+    :return: (mtime in ns, size) by path relative to the directory
+    """
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in names:
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # removed while scanning, the next poll sees it
+                continue
+            files[os.path.relpath(path, directory)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+class DirectoryWatcher(object):
+    """
+    Polls the subdirectories of a directory, one per course, and reports a subdirectory once it has not changed for
+    the debounce time, so copying several files or writing a large PDF results in a single report
+    """
+
+    def __init__(self, directory: str, on_change: Callable[[str], None], interval: float = 10,
+                 debounce: float = 30):
+        """
+        :param directory: e.g. the documents directory
+        :param on_change: called from the watcher thread with the name of the changed subdirectory
+        :param interval: seconds between two polls
+        :param debounce: seconds without further changes before a subdirectory is reported
+        """
+        self.directory = directory
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self._snapshots = None
+        # subdirectories changed but not reported yet, with the time of the last change
+        self._changed = {}
+        self._stop = threading.Event()
+
+    def poll(self, now: float = None) -> list:
+        """
+        Scan the directory once and report the subdirectories whose changes have settled
+        :param now: defaults to the current monotonic time
+        :return: names of the reported subdirectories
+        """
+        now = time.monotonic() if now is None else now
+        snapshots = self.__scan()
+        if self._snapshots is None:
+            # first scan, the current state is the baseline
+            self._snapshots = snapshots
+            return []
+
+        for name in snapshots.keys() | self._snapshots.keys():
+            if snapshots.get(name) != self._snapshots.get(name):
+                self._changed[name] = now
+        self._snapshots = snapshots
+
+        settled = [name for name, changed_at in self._changed.items() if now - changed_at >= self.debounce]
+        for name in settled:
+            del self._changed[name]
+            try:
+                self.on_change(name)
+            except Exception:
+                chatbot_logger.exception(f"Handling changes of {os.path.join(self.directory, name)} failed")
+        return settled
+
+    def start(self) -> threading.Thread:
+        """
+        Poll every interval from a background thread
+        :return: the thread
+        """
+        self.poll()
+        thread = threading.Thread(target=self.__watch, name="directory-watcher", daemon=True)
+        thread.start()
+        chatbot_logger.info(f"Watching {self.directory} for changes every {self.interval:g}s")
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def __watch(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def __scan(self) -> dict:
+        if not os.path.isdir(self.directory):
+            return {}
+        return {entry.name: snapshot(entry.path) for entry in os.scandir(self.directory)
+                if entry.is_dir() and not entry.name.startswith(".")}
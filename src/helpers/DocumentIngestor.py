@@ -0,0 +1,117 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, List, Optional
+
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+def parse_file(path: str) -> List[Document]:
+    """
+    Parse one file into documents, one per page for PDFs. Runs in a worker process.
+    :param path:
+    :return:
+    """
+    return SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+
+
+class DocumentIngestor(object):
+    """
+    Parses files in a process pool and embeds their chunks in fixed-size batches while parsing continues. Only a few
+    parsed files and one batch of chunks are held in memory at a time, independent of the number of files.
+    """
+
+    def __init__(self, embed_model: BaseEmbedding, transformations: list, workers: Optional[int] = None,
+                 embed_batch_size: int = 32):
+        """
+        :param embed_model: model embedding the chunks
+        :param transformations: node parser(s) splitting documents into chunks
+        :param workers: parsing processes, defaults to the number of CPUs; 1 parses in this process
+        :param embed_batch_size: chunks embedded and inserted together
+        """
+        self.embed_model = embed_model
+        self.transformations = transformations
+        self.workers = workers or os.cpu_count() or 1
+        self.embed_batch_size = embed_batch_size
+
+    def ingest(self, index: VectorStoreIndex, files: List[str],
+               prepare: Callable[[List[Document]], None] = None) -> dict:
+        """
+        Parse, chunk, embed and insert files into an index
+        :param index: index to insert into, persisting is left to the caller
+        :param files: paths of the files
+        :param prepare: called with the documents of each file before chunking, e.g. to enrich metadata
+        :return: statistics: files, pages, chunks, seconds
+        """
+        stats = {"files": 0, "pages": 0, "chunks": 0, "seconds": 0.0}
+        if not files:
+            return stats
+        start = time.perf_counter()
+        batch = []
+
+        for documents in self.__parse(files):
+            if prepare is not None:
+                prepare(documents)
+            for document in documents:
+                batch.extend(run_transformations([document], self.transformations))
+                index.docstore.set_document_hash(document.get_doc_id(), document.hash)
+                while len(batch) >= self.embed_batch_size:
+                    stats["chunks"] += self.__insert(index, batch[:self.embed_batch_size])
+                    batch = batch[self.embed_batch_size:]
+
+            stats["files"] += 1
+            stats["pages"] += len(documents)
+            elapsed = time.perf_counter() - start
+            chatbot_logger.info(
+                f"Ingested {stats['files']}/{len(files)} files: {stats['pages']} pages "
+                f"({stats['pages'] / elapsed:.1f} pages/s), {stats['chunks']} chunks ({stats['chunks'] / elapsed:.1f} chunks/s)")
+
+        stats["chunks"] += self.__insert(index, batch)
+        stats["seconds"] = time.perf_counter() - start
+        chatbot_logger.info(
+            f"Ingestion finished: {stats['files']} files, {stats['pages']} pages, {stats['chunks']} chunks in "
+            f"{stats['seconds']:.1f} seconds ({stats['pages'] / stats['seconds']:.1f} pages/s, "
+            f"{stats['chunks'] / stats['seconds']:.1f} chunks/s)")
+        return stats
+
+    def __parse(self, files: List[str]):
+        """Yield the documents of each file as soon as it is parsed, with at most two files per worker in flight"""
+        workers = min(self.workers, len(files))
+        if workers <= 1:
+            for path in files:
+                with metrics.span("parse"):
+                    documents = parse_file(path)
+                yield documents
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            remaining = list(reversed(files))
+            in_flight = set()
+            while True:
+                while remaining and len(in_flight) < 2 * workers:
+                    in_flight.add(executor.submit(parse_file, remaining.pop()))
+                if not in_flight:
+                    return
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def __insert(self, index: VectorStoreIndex, nodes: List[BaseNode]) -> int:
+        """Embed a batch of chunks in one call and insert them with their embeddings"""
+        if not nodes:
+            return 0
+        with metrics.span("embed_batch"):
+            embeddings = self.embed_model.get_text_embedding_batch(
+                [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes])
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        index.insert_nodes(nodes)
+        return len(nodes)
@@ -0,0 +1,137 @@
+import logging
+import os
+import tempfile
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+EMBED_MODEL_NAME = "BAAI/bge-m3"
+EMBED_BACKENDS = ("torch", "onnx")
+
+# file name of the quantized model in the export directory
+ONNX_MODEL_FNAME = "model_int8.onnx"
+
+ONNX_REQUIREMENTS = "pip install onnxruntime transformers"
+EXPORT_REQUIREMENTS = "pip install optimum[onnxruntime]"
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    BGE-M3 dense embeddings from an int8-quantized ONNX export of the model, run on the CPU with onnxruntime. Like the
+    PyTorch backend, the normalized hidden state of the CLS token is the embedding.
+    """
+
+    max_length: int = Field(default=8192, description="Maximal number of tokens per text")
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+
+    def __init__(self, model_path: str, threads: Optional[int] = None, max_length: int = 8192,
+                 embed_batch_size: int = 10, **kwargs: Any):
+        """
+        :param model_path: directory written by export_onnx_model
+        :param threads: intra-op threads of onnxruntime, defaults to the number of physical cores
+        :param max_length: longer texts are truncated
+        :param embed_batch_size:
+        """
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(f"The onnx embedding backend requires onnxruntime and transformers: {ONNX_REQUIREMENTS}") from e
+
+        # a different model name keeps the embeddings apart from those of the PyTorch backend in the embedding cache
+        super().__init__(model_name=f"{EMBED_MODEL_NAME}@onnx-int8", max_length=max_length,
+                         embed_batch_size=embed_batch_size, **kwargs)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(model_path, ONNX_MODEL_FNAME), options, providers=["CPUExecutionProvider"])
+        self._tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[Embedding]:
+        inputs = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        feed = {model_input.name: inputs[model_input.name].astype(np.int64)
+                for model_input in self._session.get_inputs() if model_input.name in inputs}
+        hidden_state = self._session.run(None, feed)[0]
+        embeddings = hidden_state[:, 0]
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed(texts)
+
+
+def create_embed_model(backend: str = "torch", onnx_model_path: str = None, threads: Optional[int] = None,
+                       embed_batch_size: int = 10, device: str = None) -> BaseEmbedding:
+    """
+    Create the BGE-M3 embedding model
+    :param backend: "torch" runs the original model with PyTorch, "onnx" the quantized export
+    :param onnx_model_path: directory of the export, required for the onnx backend
+    :param threads: CPU threads used for one embedding call
+    :param embed_batch_size:
+    :param device: PyTorch device, unused by the onnx backend
+    :return:
+    """
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend {backend}, expected one of {EMBED_BACKENDS}")
+    chatbot_logger.info(f"Using {backend} embedding backend")
+
+    if backend == "onnx":
+        if not onnx_model_path:
+            raise ValueError("The onnx embedding backend requires the path of the exported model")
+        return OnnxEmbedding(onnx_model_path, threads=threads, embed_batch_size=embed_batch_size)
+
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    if threads:
+        torch.set_num_threads(threads)
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, embed_batch_size=embed_batch_size, device=device)
+
+
+def export_onnx_model(output_dir: str, model_name: str = EMBED_MODEL_NAME):
+    """
+    Export the embedding model to ONNX and quantize its weights to int8
+    :param output_dir: directory for the quantized model and the tokenizer
+    :param model_name: Hugging Face model to export
+    :return:
+    """
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+    except ImportError as e:
+        raise ImportError(f"Exporting the embedding model requires optimum: {EXPORT_REQUIREMENTS}") from e
+
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as export_dir:
+        chatbot_logger.info(f"Exporting {model_name} to ONNX...")
+        ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(export_dir)
+
+        # dynamic quantization: int8 weights, activations are quantized per batch at runtime
+        chatbot_logger.info("Quantizing weights to int8...")
+        quantize_dynamic(os.path.join(export_dir, "model.onnx"), os.path.join(output_dir, ONNX_MODEL_FNAME),
+                         weight_type=QuantType.QInt8)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    chatbot_logger.info(f"Quantized model written to {output_dir}")
@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# file name of the cache in the index directory, next to the course indexes
+EMBEDDING_CACHE_FNAME = "embeddings.sqlite"
+
+
+def embedding_key(model_name: str, kind: str, text: str) -> str:
+    """Cache key of a text: model, kind of embedding (text or query) and content hash"""
+    return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(object):
+    """
+    Content-addressed store of embeddings in a SQLite file, shared by all courses and index rebuilds. When the store
+    grows beyond its limit, the least recently used embeddings are dropped.
+    """
+
+    def __init__(self, database: str, max_entries: int = 500000):
+        """
+        :param database: path of the SQLite file
+        :param max_entries: embeddings kept at most
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(database):
+            os.makedirs(os.path.dirname(database), exist_ok=True)
+        self._connection = sqlite3.connect(database, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up embeddings
+        :param keys:
+        :return: the found embeddings by key
+        """
+        found = {}
+        with self._lock:
+            # stay below the SQLite limit of variables per statement
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._connection.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        metrics.inc("embedding_cache_hits_total", len(found))
+        metrics.inc("embedding_cache_misses_total", len(keys) - len(found))
+        return found
+
+    def put_many(self, embeddings: Dict[str, List[float]]):
+        """
+        Store embeddings, evicting the least recently used ones beyond the limit
+        :param embeddings: embeddings by key
+        :return:
+        """
+        if not embeddings:
+            return
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in embeddings.items()])
+            self._entries += cursor.rowcount
+            # evict in steps of 10% to avoid a delete on every insert
+            if self._entries > self.max_entries:
+                evict = self._entries - int(self.max_entries * 0.9)
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (evict,))
+                self._entries -= evict
+                chatbot_logger.info(f"Embedding cache full, evicted {evict} embeddings")
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        """Hits, misses and number of stored embeddings"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._entries}
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model: document chunks are looked up in the persistent EmbeddingCache before they are
+    embedded, query embeddings are kept in a small in-memory LRU so repeated questions skip the model.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: Optional[EmbeddingCache] = PrivateAttr()
+    _queries: OrderedDict = PrivateAttr()
+    _query_cache_size: int = PrivateAttr()
+    _query_lock: Any = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: Optional[EmbeddingCache] = None,
+                 query_cache_size: int = 1024, **kwargs: Any):
+        """
+        :param embed_model: model computing missing embeddings
+        :param cache: persistent cache of chunk embeddings, None disables it
+        :param query_cache_size: query embeddings kept in memory, 0 disables the query cache
+        """
+        super().__init__(model_name=embed_model.model_name, embed_batch_size=embed_model.embed_batch_size, **kwargs)
+        self._embed_model = embed_model
+        self._cache = cache
+        self._queries = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._query_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = embedding_key(self.model_name, "query", query)
+        with self._query_lock:
+            embedding = self._queries.get(key)
+            if embedding is not None:
+                self._queries.move_to_end(key)
+        metrics.inc("query_embedding_cache_hits_total" if embedding is not None else "query_embedding_cache_misses_total")
+        if embedding is not None:
+            return embedding
+
+        embedding = self._embed_model._get_query_embedding(query)
+        if self._query_cache_size > 0:
+            with self._query_lock:
+                self._queries[key] = embedding
+                while len(self._queries) > self._query_cache_size:
+                    self._queries.popitem(last=False)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """
+        Embed many queries at once and keep them in the query cache, e.g. before answering a batch of questions.
+        BGE-M3 embeds queries without an instruction, like texts, so missing queries are embedded in batches.
+        :param queries:
+        :return: embeddings in the order of the queries
+        """
+        keys = [embedding_key(self.model_name, "query", query) for query in queries]
+        with self._query_lock:
+            found = {key: self._queries[key] for key in keys if key in self._queries}
+        missing = list(dict.fromkeys(query for query, key in zip(queries, keys) if key not in found))
+        metrics.inc("query_embedding_cache_hits_total", len(queries) - len(missing))
+        metrics.inc("query_embedding_cache_misses_total", len(missing))
+        for start in range(0, len(missing), self.embed_batch_size):
+            batch = missing[start:start + self.embed_batch_size]
+            for query, embedding in zip(batch, self._embed_model._get_text_embeddings(batch)):
+                found[embedding_key(self.model_name, "query", query)] = embedding
+        if self._query_cache_size > 0:
+            with self._query_lock:
+                for key in keys:
+                    self._queries[key] = found[key]
+                    self._queries.move_to_end(key)
+                while len(self._queries) > self._query_cache_size:
+                    self._queries.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        if self._cache is None:
+            return self._embed_model._get_text_embeddings(texts)
+
+        keys = [embedding_key(self.model_name, "text", text) for text in texts]
+        found = self._cache.get_many(keys)
+        missing = [position for position, key in enumerate(keys) if key not in found]
+        if missing:
+            computed = self._embed_model._get_text_embeddings([texts[position] for position in missing])
+            new = {keys[position]: embedding for position, embedding in zip(missing, computed)}
+            self._cache.put_many(new)
+            found.update(new)
+        return [found[key] for key in keys]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embedding(text)
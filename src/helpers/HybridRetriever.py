@@ -0,0 +1,120 @@
+import math
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from src.helpers.MmapVectorStore import MmapVectorStore
+from src.metrics import metrics
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and numbers, e.g. names and paragraph numbers"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index(object):
+    """
+    In-memory inverted index scoring texts with Okapi BM25
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.size = len(texts)
+        postings = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[position] = sum(counts.values())
+            for term, count in counts.items():
+                positions, frequencies = postings.setdefault(term, ([], []))
+                positions.append(position)
+                frequencies.append(count)
+
+        average_length = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        # length normalization of the term frequency per text
+        self._norms = k1 * (1 - b + b * lengths / average_length)
+        self._postings = {}
+        for term, (positions, frequencies) in postings.items():
+            idf = math.log(1 + (self.size - len(positions) + 0.5) / (len(positions) + 0.5))
+            self._postings[term] = (np.asarray(positions), np.asarray(frequencies, dtype=np.float32), idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every text for a query
+        :param query:
+        :return: scores in the order of the texts, 0 for texts without a query term
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            positions, frequencies, idf = self._postings[term]
+            scores[positions] += idf * frequencies * (self.k1 + 1) / (frequencies + self._norms[positions])
+        return scores
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves nodes by fusing exact dense similarity with BM25 over a candidate pool that is wider than the result.
+    The lexical score boosts the cosine similarity multiplicatively and the priority from sources.json is applied
+    before the top k are chosen, so scores stay comparable to those of pure vector retrieval.
+    """
+
+    def __init__(self, index: VectorStoreIndex, similarity_top_k: int = 3, candidate_pool: int = 20,
+                 lexical_weight: float = 0.3):
+        """
+        :param index: index backed by a MmapVectorStore
+        :param similarity_top_k: nodes returned
+        :param candidate_pool: best nodes of each of dense and lexical retrieval considered for fusion
+        :param lexical_weight: maximal relative boost of the best lexical match
+        """
+        if not isinstance(index.vector_store, MmapVectorStore):
+            raise ValueError("HybridRetriever requires an index backed by a MmapVectorStore")
+        super().__init__(callback_manager=index._callback_manager)
+        self._vector_store = index.vector_store
+        self._embed_model = index._embed_model
+        self.similarity_top_k = similarity_top_k
+        self.candidate_pool = candidate_pool
+        self.lexical_weight = lexical_weight
+
+        # nodes in the order of the stored vectors
+        node_ids = self._vector_store.node_ids
+        self._nodes = index.docstore.get_nodes(node_ids) if node_ids else []
+        self._priorities = np.asarray([node.metadata.get("priority", 1.0) for node in self._nodes], dtype=np.float32)
+        with metrics.span("bm25_build"):
+            self._bm25 = BM25Index([node.get_content(metadata_mode=MetadataMode.EMBED) for node in self._nodes])
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if not self._nodes:
+            return []
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+
+        with metrics.span("retrieve_dense"):
+            dense = self._vector_store.similarities(query_bundle.embedding)
+        with metrics.span("retrieve_lexical"):
+            lexical = self._bm25.scores(query_bundle.query_str)
+
+        with metrics.span("retrieve_fusion"):
+            pool_size = min(self.candidate_pool, len(self._nodes))
+            candidates = np.argpartition(-dense, pool_size - 1)[:pool_size]
+            matched = np.flatnonzero(lexical)
+            if len(matched):
+                lexical_size = min(self.candidate_pool, len(matched))
+                matched = matched[np.argpartition(-lexical[matched], lexical_size - 1)[:lexical_size]]
+                candidates = np.union1d(candidates, matched)
+
+            best_lexical = lexical[candidates].max()
+            boost = lexical[candidates] / best_lexical if best_lexical > 0 else 0
+            scores = dense[candidates] * (1 + self.lexical_weight * boost) * self._priorities[candidates]
+            order = np.argsort(-scores)[:self.similarity_top_k]
+
+        return [NodeWithScore(node=self._nodes[candidates[position]], score=float(scores[position]))
+                for position in order]
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import PureWindowsPath
+
+MANIFEST_FNAME = "manifest.json"
+SOURCES_FNAME = "sources.json"
+
+
+def document_file_name(file_path: str) -> str:
+    """
+    File name of a document path, independent of the OS the index was built on
+    :param file_path: path as stored in the document metadata
+    :return:
+    """
+    # PureWindowsPath understands both separators
+    return PureWindowsPath(file_path).name
+
+
+def file_hash(file_path: str) -> str:
+    """
+    sha256 of a file's content
+    :param file_path:
+    :return:
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+@dataclass
+class ManifestDiff:
+    added: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def __str__(self):
+        return f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed"
+
+
+class IndexManifest(object):
+    """
+    State of the documents an index was built from, stored next to the index. Maps file names to size, mtime, content
+    hash and the sources.json entry of the file.
+    """
+
+    def __init__(self, entries: dict = None):
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "IndexManifest":
+        """
+        Load the manifest of an index, empty if there is none yet
+        :param persist_dir:
+        :return:
+        """
+        try:
+            with open(os.path.join(persist_dir, MANIFEST_FNAME), encoding="utf-8") as manifest_file:
+                return cls(json.load(manifest_file)["files"])
+        except FileNotFoundError:
+            return cls()
+
+    def persist(self, persist_dir: str):
+        """
+        Write the manifest; replaces the old file atomically
+        :param persist_dir:
+        :return:
+        """
+        os.makedirs(persist_dir, exist_ok=True)
+        path = os.path.join(persist_dir, MANIFEST_FNAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump({"files": self.entries}, manifest_file, indent=2, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def scan(self, data_dir: str, sources: dict) -> "IndexManifest":
+        """
+        Build the manifest of the current directory content. Content is only hashed again if size or mtime changed.
+        :param data_dir: documents directory of a course
+        :param sources: sources.json entries by file name
+        :return:
+        """
+        entries = {}
+        for file_name in sorted(os.listdir(data_dir)):
+            file_path = os.path.join(data_dir, file_name)
+            if file_name == SOURCES_FNAME or file_name.startswith(".") or not os.path.isfile(file_path):
+                continue
+
+            stat = os.stat(file_path)
+            previous = self.entries.get(file_name)
+            if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime_ns:
+                content_hash = previous["hash"]
+            else:
+                content_hash = file_hash(file_path)
+
+            entries[file_name] = {
+                "path": file_path,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "hash": content_hash,
+                "source": sources.get(file_name),
+            }
+        return IndexManifest(entries)
+
+    def diff(self, current: "IndexManifest") -> ManifestDiff:
+        """
+        Files that have to be (re-)indexed or removed to get from this manifest to the current one
+        :param current: manifest of the directory content
+        :return:
+        """
+        diff = ManifestDiff()
+        for file_name, entry in current.entries.items():
+            previous = self.entries.get(file_name)
+            if previous is None:
+                diff.added.append(file_name)
+            elif previous["hash"] != entry["hash"] or previous["source"] != entry["source"]:
+                diff.changed.append(file_name)
+        diff.removed = [file_name for file_name in self.entries if file_name not in current.entries]
+        return diff
@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.query_engine import CitationQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+def directory_size(path: str) -> int:
+    """Size of the files in a directory in bytes, used as estimate of the memory of a loaded index"""
+    if not os.path.isdir(path):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+@dataclass(frozen=True)
+class CourseEngine:
+    """
+    Everything needed to answer questions for one course. Instances are never modified after creation, a refresh
+    builds a new one and swaps it in.
+    """
+    index: VectorStoreIndex
+    retriever: BaseRetriever
+    query_engine: CitationQueryEngine
+    direct_engine: CitationQueryEngine
+    direct_streaming_engine: CitationQueryEngine
+
+
+class IndexRegistry(object):
+    """
+    Long-lived in-memory registry of loaded course engines, keyed by course. If the estimated size of the loaded
+    engines exceeds the memory budget, the least recently used ones are unloaded.
+    """
+
+    def __init__(self, memory_budget: int = 0):
+        """
+        :param memory_budget: bytes of all loaded engines at most, 0 for no limit
+        """
+        self.memory_budget = memory_budget
+        self._engines = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, course) -> CourseEngine:
+        """
+        Get the current engine of a course
+        :param course:
+        :return: the engine; callers keep using it even if it is swapped out meanwhile
+        """
+        with self._lock:
+            engine = self._engines.get(course)
+            if engine is not None:
+                self._engines.move_to_end(course)
+        if engine is None:
+            raise KeyError(f"No index loaded for course {course}")
+        return engine
+
+    def swap(self, course, engine: CourseEngine, size: int = 0):
+        """
+        Atomically replace the engine of a course, then unload least recently used engines beyond the memory budget
+        :param course:
+        :param engine: the new engine
+        :param size: estimated memory of the engine in bytes
+        :return: the replaced engine or None
+        """
+        with self._lock:
+            old_engine = self._engines.get(course)
+            self._engines[course] = engine
+            self._engines.move_to_end(course)
+            self._sizes[course] = size
+            evicted = self.__evict(keep=course)
+        for evicted_course in evicted:
+            chatbot_logger.info(f"Unloaded index of course {evicted_course} to stay within the memory budget")
+        return old_engine
+
+    def __evict(self, keep) -> list:
+        evicted = []
+        if self.memory_budget <= 0:
+            return evicted
+        while sum(self._sizes.values()) > self.memory_budget and len(self._engines) > 1:
+            course = next(iter(self._engines))
+            if course == keep:
+                break
+            del self._engines[course]
+            del self._sizes[course]
+            evicted.append(course)
+        return evicted
+
+    def remove(self, course):
+        """
+        Unload the engine of a course
+        :param course:
+        :return: the removed engine or None
+        """
+        with self._lock:
+            self._sizes.pop(course, None)
+            return self._engines.pop(course, None)
+
+    def loaded(self) -> list:
+        """Courses with a loaded engine, least recently used first"""
+        with self._lock:
+            return list(self._engines)
+
+    def __contains__(self, course) -> bool:
+        with self._lock:
+            return course in self._engines
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import re
+import shutil
+from typing import Callable, Optional
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# names the current version of the index of a course
+CURRENT_FNAME = "current.json"
+VERSION_DIRNAME = "v{}"
+VERSION_DIR = re.compile(r"^v(\d+)$")
+# index files written directly into the course directory by versions of the bot without index versions
+LEGACY_FNAME = re.compile(r"^(.*store\.json|vectors.*\.(json|npy))$")
+
+
+def current_version(persist_dir: str) -> Optional[int]:
+    """
+    :param persist_dir: index directory of a course
+    :return: current version, None if the index is not versioned yet or does not exist
+    """
+    try:
+        with open(os.path.join(persist_dir, CURRENT_FNAME), encoding="utf-8") as current_file:
+            return json.load(current_file)["version"]
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(persist_dir: str, version: Optional[int]) -> str:
+    """Directory of a version of the index, the course directory itself for an index that is not versioned yet"""
+    return persist_dir if version is None else os.path.join(persist_dir, VERSION_DIRNAME.format(version))
+
+
+def current_dir(persist_dir: str) -> str:
+    """Directory of the current version of the index of a course"""
+    return version_dir(persist_dir, current_version(persist_dir))
+
+
+def load_current(persist_dir: str, load: Callable[[str], object]):
+    """
+    Load the current version of an index, again if it was replaced while loading
+    :param persist_dir: index directory of a course
+    :param load: loads the index files of a directory, raises FileNotFoundError if a file is missing
+    :return: result of load
+    """
+    for attempt in range(3):
+        version = current_version(persist_dir)
+        try:
+            return load(version_dir(persist_dir, version))
+        except FileNotFoundError:
+            # missing files of the version just read mean there is no index; otherwise the version was removed by
+            # two updates since reading current.json
+            if attempt == 2 or current_version(persist_dir) == version:
+                raise
+
+
+def persist_version(persist_dir: str, persist: Callable[[str], None]) -> int:
+    """
+    Write a new version of an index and switch readers to it. Loading processes get either the previous or the new
+    version completely, the files of the previous version are kept for processes that just read current.json.
+    :param persist_dir: index directory of a course
+    :param persist: writes the index files into the given directory
+    :return: the new version
+    """
+    previous = current_version(persist_dir)
+    version = (previous or 0) + 1
+    directory = version_dir(persist_dir, version)
+    # left over by an update that failed before switching
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    persist(directory)
+
+    current_path = os.path.join(persist_dir, CURRENT_FNAME)
+    with open(current_path + ".tmp", "w", encoding="utf-8") as current_file:
+        json.dump({"version": version}, current_file)
+    os.replace(current_path + ".tmp", current_path)
+
+    for name in os.listdir(persist_dir):
+        match = VERSION_DIR.match(name)
+        path = os.path.join(persist_dir, name)
+        if match and int(match.group(1)) not in (version, previous):
+            # files still mapped by other processes stay readable on POSIX; on Windows they are removed by a later
+            # update
+            shutil.rmtree(path, ignore_errors=True)
+        elif LEGACY_FNAME.match(name) and os.path.isfile(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                chatbot_logger.warning(f"Could not remove {path}: {e}")
+    return version
@@ -0,0 +1,65 @@
+from typing import Any, Optional, Union
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.llms.ollama import Ollama
+from ollama import AsyncClient, Client
+
+
+class _KeepAliveClient(Client):
+    def __init__(self, keep_alive: Optional[Union[float, str]], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._keep_alive = keep_alive
+
+    def chat(self, *args: Any, **kwargs: Any):
+        kwargs.setdefault("keep_alive", self._keep_alive)
+        return super().chat(*args, **kwargs)
+
+    def generate(self, *args: Any, **kwargs: Any):
+        kwargs.setdefault("keep_alive", self._keep_alive)
+        return super().generate(*args, **kwargs)
+
+
+class _KeepAliveAsyncClient(AsyncClient):
+    def __init__(self, keep_alive: Optional[Union[float, str]], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._keep_alive = keep_alive
+
+    async def chat(self, *args: Any, **kwargs: Any):
+        kwargs.setdefault("keep_alive", self._keep_alive)
+        return await super().chat(*args, **kwargs)
+
+
+class KeepAliveOllama(Ollama):
+    """
+    Ollama LLM that asks the server to keep the model loaded for keep_alive after every request, instead of the
+    server default of five minutes
+    """
+
+    keep_alive: Optional[Union[float, str]] = Field(
+        default=None, description="How long the model stays loaded after a request, e.g. '30m', -1 for ever")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "KeepAliveOllama"
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            self._client = _KeepAliveClient(self.keep_alive, host=self.base_url, timeout=self.request_timeout)
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncClient:
+        if self._async_client is None:
+            self._async_client = _KeepAliveAsyncClient(self.keep_alive, host=self.base_url, timeout=self.request_timeout)
+        return self._async_client
+
+    def ping(self, prompt: str = "Hallo", max_tokens: int = 1) -> dict:
+        """
+        Generate a few tokens with the options of regular requests, which loads the model if needed
+        :param prompt:
+        :param max_tokens:
+        :return: raw Ollama response, load_duration is the time spent loading the model in nanoseconds
+        """
+        return self.client.generate(
+            model=self.model, prompt=prompt, options={**self._model_kwargs, "num_predict": max_tokens})
@@ -0,0 +1,154 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+
+from src.discord.DiscordBot import (OVERLOADED_MESSAGE, USER_LIMIT_MESSAGE,
+                                    DiscordBot)
+from src.discord.FakeChannel import FakeDMChannel, FakeUser
+from src.discord.QueryScheduler import QueryScheduler
+from src.discord.disclaimer import disclaimer
+from src.helpers.Benchmark import percentile
+from src.QueryResult import ERROR_ANSWER
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# a step is saturated if more questions are rejected or the tail latency grows by this factor compared to the lowest
+# arrival rate, i.e. questions arrive faster than they are answered and the queue grows
+MAX_REJECTED_SHARE = 0.01
+MAX_LATENCY_GROWTH = 3.0
+
+_user_ids = itertools.count(1000)
+
+
+class TimedScheduler(QueryScheduler):
+    """QueryScheduler recording when the query of each user leaves the queue and starts running"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = {}
+
+    async def submit(self, user_id, fn, on_queued=None):
+        def timed():
+            self.started[user_id] = time.perf_counter()
+            return fn()
+
+        return await super().submit(user_id, timed, on_queued=on_queued)
+
+
+async def ask(bot: DiscordBot, scheduler: TimedScheduler, item: dict) -> dict:
+    """
+    Send a question as a new student in a DM channel whose course and disclaimer are already pinned
+    :param bot:
+    :param scheduler: the scheduler of the bot
+    :param item: question and course, as loaded by load_batch
+    :return: latency and queue delay in seconds, whether the question was rejected or failed; a question fails if
+        on_message raises or the ChatBot answers with its error answer
+    """
+    user_id = next(_user_ids)
+    channel = FakeDMChannel(user_id, FakeUser(user_id), bot.user)
+    await (await channel.send(f"Kurs: {item['course'].upper()}")).pin()
+    await (await channel.send(disclaimer.strip())).pin()
+    channel.sent.clear()
+
+    arrival = time.perf_counter()
+    error = None
+    try:
+        await bot.on_message(channel.message(item["question"]))
+    except Exception as e:
+        chatbot_logger.exception(f"Load test question {item['id']} failed")
+        error = repr(e)
+    latency = time.perf_counter() - arrival
+
+    started = scheduler.started.pop(user_id, None)
+    replies = [message.content for message in channel.sent]
+    if error is None and any(ERROR_ANSWER in reply for reply in replies):
+        # the ChatBot catches failed queries, e.g. Ollama timeouts, and answers with its error answer
+        error = "error answer"
+    return {"latency": latency, "queue_delay": None if started is None else started - arrival, "error": error,
+            "rejected": error is None and any(reply in (OVERLOADED_MESSAGE, USER_LIMIT_MESSAGE) for reply in replies)}
+
+
+async def run_step(bot: DiscordBot, scheduler: TimedScheduler, items: list, rate: float, duration: float,
+                   rng: random.Random) -> dict:
+    """
+    Send questions at random (Poisson) arrivals for duration seconds and wait until all of them are answered
+    :param bot:
+    :param scheduler: the scheduler of the bot
+    :param items: questions drawn at random
+    :param rate: questions per second on average
+    :param duration: seconds questions arrive
+    :param rng:
+    :return: statistics of the step
+    """
+    tasks = []
+    start = time.perf_counter()
+    arrival = rng.expovariate(rate)
+    while arrival < duration:
+        await asyncio.sleep(max(0.0, start + arrival - time.perf_counter()))
+        tasks.append(asyncio.create_task(ask(bot, scheduler, rng.choice(items))))
+        arrival += rng.expovariate(rate)
+    results = await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - start
+
+    answered = [result for result in results if not result["rejected"] and result["error"] is None]
+    latencies = [result["latency"] for result in answered]
+    queue_delays = [result["queue_delay"] for result in answered if result["queue_delay"] is not None]
+    step = {"rate": rate, "arrivals": len(results), "answered": len(answered),
+            "rejected": sum(result["rejected"] for result in results),
+            "errors": sum(result["error"] is not None for result in results),
+            "seconds": round(seconds, 3), "throughput": round(len(answered) / seconds, 3)}
+    for name, values in (("latency", latencies), ("queue_delay", queue_delays)):
+        for percent in (50, 95, 99):
+            step[f"{name}_p{percent}"] = round(percentile(values, percent), 3) if values else None
+        step[f"{name}_max"] = round(max(values), 3) if values else None
+    return step
+
+
+def is_saturated(step: dict, baseline: dict) -> bool:
+    """
+    Whether the deployment could not keep up with the arrival rate of a step
+    :param step:
+    :param baseline: step with the lowest arrival rate
+    :return:
+    """
+    if step["arrivals"] == 0:
+        return False
+    if step["rejected"] + step["errors"] > MAX_REJECTED_SHARE * step["arrivals"]:
+        return True
+    return bool(baseline["latency_p95"] and step["latency_p95"]
+                and step["latency_p95"] > MAX_LATENCY_GROWTH * baseline["latency_p95"])
+
+
+async def run_load_test(bot: DiscordBot, scheduler: TimedScheduler, items: list, rates: list, duration: float,
+                        seed: int = 0, stop_when_saturated: bool = True) -> list:
+    """
+    Replay the questions at increasing arrival rates through DiscordBot.on_message
+    :param bot: bot whose user is set, its channels are never connected to Discord
+    :param scheduler: the scheduler of the bot
+    :param items: questions and courses, as loaded by load_batch
+    :param rates: questions per second of the steps
+    :param duration: seconds questions arrive in each step
+    :param seed: of the random arrivals and question choice
+    :param stop_when_saturated: skip the higher rates once a step is saturated
+    :return: statistics per step, with "saturated"
+    """
+    rng = random.Random(seed)
+    steps = []
+    for rate in sorted(rates):
+        chatbot_logger.info(f"Load test: {rate:g} questions/s for {duration:g}s")
+        step = await run_step(bot, scheduler, items, rate, duration, rng)
+        step["saturated"] = is_saturated(step, steps[0] if steps else step)
+        steps.append(step)
+        if step["saturated"] and stop_when_saturated:
+            break
+    return steps
+
+
+def saturation_point(steps: list):
+    """
+    :param steps: of run_load_test
+    :return: lowest arrival rate the deployment could not keep up with, None if it kept up with all of them
+    """
+    return next((step["rate"] for step in steps if step["saturated"]), None)
@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+
+from src.metrics import TOKEN_RATE_BUCKETS, metrics
+
+# pipeline stages timed from llama-index events
+STAGES = {
+    CBEventType.EMBEDDING: "embed",
+    CBEventType.RETRIEVE: "retrieve",
+    CBEventType.SYNTHESIZE: "synthesize",
+    CBEventType.LLM: "llm",
+    CBEventType.AGENT_STEP: "agent_step",
+    CBEventType.FUNCTION_CALL: "tool_call",
+}
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records the duration of llama-index events as pipeline stages, and the token throughput and prompt processing
+    time reported by Ollama
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._starts = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None, event_id: str = "",
+                       parent_id: str = "", **kwargs: Any) -> str:
+        if event_type in STAGES:
+            with self._lock:
+                self._starts[event_id] = time.perf_counter()
+        return event_id
+
+    def on_event_end(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None, event_id: str = "",
+                     **kwargs: Any) -> None:
+        if event_type not in STAGES:
+            return
+        with self._lock:
+            start = self._starts.pop(event_id, None)
+        if start is not None:
+            metrics.observe("stage_seconds", time.perf_counter() - start, stage=STAGES[event_type])
+
+        if event_type == CBEventType.LLM and payload:
+            self.__record_tokens(payload.get(EventPayload.RESPONSE))
+
+    @staticmethod
+    def __record_tokens(response):
+        """Ollama reports generated tokens and generation time in the raw response"""
+        raw = getattr(response, "raw", None)
+        if raw is None or not hasattr(raw, "get"):
+            return
+        eval_count, eval_duration = raw.get("eval_count"), raw.get("eval_duration")
+        if eval_count:
+            metrics.inc("llm_tokens_total", eval_count)
+        if eval_count and eval_duration:
+            metrics.observe("llm_tokens_per_second", eval_count / (eval_duration / 1e9), buckets=TOKEN_RATE_BUCKETS)
+
+        # prompt tokens and the time to process them before the first generated token
+        prompt_count, prompt_duration = raw.get("prompt_eval_count"), raw.get("prompt_eval_duration")
+        if prompt_count:
+            metrics.inc("llm_prompt_tokens_total", prompt_count)
+        if prompt_count and prompt_duration:
+            metrics.observe("llm_prompt_seconds", prompt_duration / 1e9)
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import (BasePydanticVectorStore,
+                                                  VectorStoreQuery,
+                                                  VectorStoreQueryMode,
+                                                  VectorStoreQueryResult)
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+VECTORS_FNAME = "vectors{}.npy"
+SCALES_FNAME = "vectors_scale{}.npy"
+META_FNAME = "vectors.json"
+JSON_VECTOR_STORE_FNAME = "default__vector_store.json"
+
+DTYPES = ("float32", "float16", "int8")
+
+# rows scored per matrix multiplication, keeps temporary float32 copies of quantized rows small
+SEARCH_BLOCK_SIZE = 65536
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    """
+    Normalize vectors to unit length and convert them to the storage type
+    :param vectors: float32 matrix, one vector per row
+    :param dtype: one of DTYPES
+    :return: stored matrix and per-row scales (int8 only, otherwise None)
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+def _dequantize(matrix: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * scales[:, None]
+    return matrix
+
+
+def _vector_paths(persist_dir: str, version: Optional[int] = None) -> tuple:
+    """Paths of the matrix and the int8 scales, stores of the previous index layout name a version"""
+    suffix = "" if version is None else f".{version}"
+    return (os.path.join(persist_dir, VECTORS_FNAME.format(suffix)),
+            os.path.join(persist_dir, SCALES_FNAME.format(suffix)))
+
+
+def _read_meta(persist_dir: str) -> Optional[dict]:
+    meta_path = os.path.join(persist_dir, META_FNAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as meta_file:
+        return json.load(meta_file)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping all embeddings in one contiguous matrix that is memory-mapped from a .npy file. Vectors are
+    stored normalized, so cosine similarity is a single matrix-vector product. Several processes loading the same index
+    share the mapped pages.
+
+    The store is persisted with the other index files into a new directory on every update (see IndexVersions), so
+    its files are never replaced while another process loads them.
+    """
+
+    stores_text: bool = False
+    dtype: str = Field(default="float32", description="Storage type of the vectors: float32, float16 or int8")
+
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    # vectors and scales of the batches added since the matrix was last built
+    _added: List[tuple] = PrivateAttr(default_factory=list)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+
+    def __init__(self, dtype: str = "float32", **kwargs: Any):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype}, expected one of {DTYPES}")
+        super().__init__(dtype=dtype, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, dtype: str = "float32") -> "MmapVectorStore":
+        """
+        Load the store of an index directory, a missing store results in an empty one. Nothing is written, a JSON
+        vector store of an index persisted by older versions is converted in memory.
+        :param persist_dir:
+        :param dtype: storage type; stored vectors of another type are converted and written on the next persist
+        :return:
+        """
+        meta = _read_meta(persist_dir)
+        if meta is None:
+            json_path = os.path.join(persist_dir, JSON_VECTOR_STORE_FNAME)
+            return cls.from_json_store(json_path, dtype) if os.path.exists(json_path) else cls(dtype=dtype)
+
+        store = cls(dtype=dtype)
+        store._load(persist_dir, meta)
+        if meta["dtype"] != dtype and store._ids:
+            chatbot_logger.warning(f"Converting vectors in {persist_dir} from {meta['dtype']} to {dtype}")
+            store._matrix, store._scales = _quantize(_dequantize(store._matrix, store._scales), dtype)
+        return store
+
+    @classmethod
+    def from_json_store(cls, json_path: str, dtype: str = "float32") -> "MmapVectorStore":
+        """
+        Convert a persisted SimpleVectorStore (default__vector_store.json)
+        :param json_path:
+        :param dtype: storage type of the converted vectors
+        :return:
+        """
+        chatbot_logger.info(f"Converting {json_path} to binary vector store...")
+        data = SimpleVectorStore.from_persist_path(json_path).data
+        store = cls(dtype=dtype)
+        if data.embedding_dict:
+            store._ids = list(data.embedding_dict.keys())
+            store._ref_doc_ids = [data.text_id_to_ref_doc_id.get(node_id, "None") for node_id in store._ids]
+            store._matrix, store._scales = _quantize(
+                np.asarray(list(data.embedding_dict.values()), dtype=np.float32), dtype)
+        return store
+
+    def _load(self, persist_dir: str, meta: dict):
+        matrix_path, scales_path = _vector_paths(persist_dir, meta.get("version"))
+        matrix, scales = None, None
+        if meta["ids"]:
+            matrix = np.load(matrix_path, mmap_mode="r")
+            if meta["dtype"] == "int8":
+                scales = np.load(scales_path)
+        self._matrix, self._scales = matrix, scales
+        self._ids = meta["ids"]
+        self._ref_doc_ids = meta["ref_doc_ids"]
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def node_ids(self) -> List[str]:
+        """Ids of the stored nodes, in the order of the similarities"""
+        return list(self._ids)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """
+        Add nodes to the store. The batches are only collected, the matrix is built once when it is needed next, i.e.
+        by a query, a deletion or persist.
+        """
+        if not nodes:
+            return []
+        self._added.append(_quantize(
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32), self.dtype))
+        self._ids.extend(node.node_id for node in nodes)
+        self._ref_doc_ids.extend(node.ref_doc_id or "None" for node in nodes)
+        return [node.node_id for node in nodes]
+
+    def _build(self):
+        """Append the added batches to the matrix with one copy; the mapped matrix is copied to memory"""
+        if not self._added:
+            return
+        matrices = ([] if self._matrix is None else [self._matrix]) + [vectors for vectors, _ in self._added]
+        self._matrix = np.concatenate(matrices)
+        if self.dtype == "int8":
+            scales = ([] if self._scales is None else [self._scales]) + [scales for _, scales in self._added]
+            self._scales = np.concatenate(scales)
+        self._added = []
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._keep([doc_id != ref_doc_id for doc_id in self._ref_doc_ids])
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters")
+        node_ids = set(node_ids or [])
+        self._keep([node_id not in node_ids for node_id in self._ids])
+
+    def clear(self) -> None:
+        self._matrix, self._scales = None, None
+        self._added = []
+        self._ids, self._ref_doc_ids = [], []
+
+    def _keep(self, mask: List[bool]):
+        if all(mask):
+            return
+        self._build()
+        mask = np.asarray(mask, dtype=bool)
+        self._matrix = self._matrix[mask]
+        if self._scales is not None:
+            self._scales = self._scales[mask]
+        self._ids = [node_id for node_id, keep in zip(self._ids, mask) if keep]
+        self._ref_doc_ids = [doc_id for doc_id, keep in zip(self._ref_doc_ids, mask) if keep]
+
+    def similarities(self, query_embedding: List[float]) -> np.ndarray:
+        """
+        Cosine similarity of the query to every stored vector
+        :param query_embedding:
+        :return: similarities in the order of the stored ids
+        """
+        if not self._ids:
+            return np.zeros(0, dtype=np.float32)
+        self._build()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / (norm if norm else 1)
+
+        scores = np.empty(len(self._ids), dtype=np.float32)
+        for start in range(0, len(self._ids), SEARCH_BLOCK_SIZE):
+            block = np.asarray(self._matrix[start:start + SEARCH_BLOCK_SIZE], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if self._scales is not None:
+            scores *= self._scales
+        return scores
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+
+        scores = self.similarities(query.query_embedding)
+        positions = np.arange(len(scores))
+        if query.node_ids is not None:
+            allowed = set(query.node_ids)
+            positions = np.asarray([i for i, node_id in enumerate(self._ids) if node_id in allowed], dtype=int)
+
+        top_k = min(query.similarity_top_k, len(positions))
+        if top_k == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        candidates = positions[np.argpartition(-scores[positions], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return VectorStoreQueryResult(
+            similarities=scores[candidates].tolist(), ids=[self._ids[i] for i in candidates])
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        """
+        Write the store next to the other index files
+        :param persist_path: path of the default vector store file, only its directory is used
+        :param fs: unused, only local files are supported
+        :return:
+        """
+        persist_dir = os.path.dirname(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+        matrix_path, scales_path = _vector_paths(persist_dir)
+
+        self._build()
+        matrix = self._matrix if self._matrix is not None else np.zeros((0, 0), dtype=self.dtype)
+        _atomic_save(matrix_path, matrix)
+        if self._scales is not None:
+            _atomic_save(scales_path, self._scales)
+
+        meta_path = os.path.join(persist_dir, META_FNAME)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as meta_file:
+            json.dump({"dtype": self.dtype, "ids": self._ids, "ref_doc_ids": self._ref_doc_ids}, meta_file)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        # remap the written file instead of keeping a private copy in memory
+        if self._ids:
+            self._matrix = np.load(matrix_path, mmap_mode="r")
+
+
+def _atomic_save(path: str, array: np.ndarray):
+    with open(path + ".tmp", "wb") as file:
+        np.save(file, array)
+    os.replace(path + ".tmp", path)
+
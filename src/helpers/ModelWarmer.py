@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import LLM
+
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# Ollama reports how long loading the model took; above this the model was not in memory
+COLD_LOAD_SECONDS = 0.5
+
+
+def parse_hours(hours: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Parse a range of hours of the day
+    :param hours: e.g. "7-22" for 07:00 until 21:59, empty for the whole day
+    :return: first and end hour or None
+    """
+    if not hours:
+        return None
+    start, end = (int(hour) for hour in hours.split("-"))
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise ValueError(f"Invalid hours {hours}, expected e.g. 7-22")
+    return start, end
+
+
+class ModelWarmer(object):
+    """
+    Loads the embedding model and the LLM before the first question and keeps them loaded by pinging them
+    periodically during the configured hours
+    """
+
+    def __init__(self, llm: LLM, embed_model: BaseEmbedding, interval: float = 240, hours: str = None):
+        """
+        :param llm: language model, pinged with a one-token generation if it is served by Ollama
+        :param embed_model: embedding model without caches, so every ping runs the model
+        :param interval: seconds between two pings, should be below the keep_alive of Ollama
+        :param hours: hours of the day to keep the models warm, e.g. "7-22", empty for the whole day
+        """
+        self.llm = llm
+        self.embed_model = embed_model
+        self.interval = interval
+        self.hours = parse_hours(hours)
+        self._stop = threading.Event()
+
+    def warm_up(self):
+        """
+        Load both models by running them twice, the first call is cold and the second one warm
+        :return:
+        """
+        chatbot_logger.info("Warming up models...")
+        for state in ("cold", "warm"):
+            embed_seconds = self.__ping_embed_model()
+            llm_seconds, load_seconds = self.__ping_llm()
+            chatbot_logger.info(
+                f"Warm-up ({state}): embedding {embed_seconds:.3f}s, LLM {llm_seconds:.3f}s "
+                f"(model load {load_seconds:.3f}s)")
+
+    def start(self) -> threading.Thread:
+        """
+        Ping the models every interval from a background thread
+        :return: the thread
+        """
+        thread = threading.Thread(target=self.__keep_warm, name="keep-warm", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def active(self, now: time.struct_time = None) -> bool:
+        """Whether the models are kept warm at the given time, defaults to now"""
+        if self.hours is None:
+            return True
+        hour = (now or time.localtime()).tm_hour
+        start, end = self.hours
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def __keep_warm(self):
+        while not self._stop.wait(self.interval):
+            if not self.active():
+                continue
+            try:
+                embed_seconds = self.__ping_embed_model()
+                llm_seconds, load_seconds = self.__ping_llm()
+            except Exception as e:
+                chatbot_logger.warning(f"Keep-warm ping failed: {e}")
+                continue
+            state = "cold" if load_seconds > COLD_LOAD_SECONDS else "warm"
+            metrics.inc("keep_warm_pings_total", state=state)
+            log = chatbot_logger.warning if state == "cold" else chatbot_logger.debug
+            log(f"Keep-warm ping ({state}): embedding {embed_seconds:.3f}s, LLM {llm_seconds:.3f}s "
+                f"(model load {load_seconds:.3f}s)")
+
+    def __ping_embed_model(self) -> float:
+        start = time.perf_counter()
+        self.embed_model.get_query_embedding("Wann beginnt das Semester?")
+        seconds = time.perf_counter() - start
+        metrics.observe("warmup_seconds", seconds, model="embedding")
+        return seconds
+
+    def __ping_llm(self) -> Tuple[float, float]:
+        """
+        :return: seconds of the request and seconds Ollama spent loading the model
+        """
+        start = time.perf_counter()
+        if hasattr(self.llm, "ping"):
+            response = self.llm.ping()
+            load_seconds = (response.get("load_duration") or 0) / 1e9
+        else:
+            self.llm.complete("Hallo")
+            load_seconds = 0.0
+        seconds = time.perf_counter() - start
+        metrics.observe("warmup_seconds", seconds, model="llm")
+        return seconds, load_seconds
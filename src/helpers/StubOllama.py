@@ -0,0 +1,132 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# the ReAct agent accepts an answer without tool call, the direct mode strips the "Answer:" prefix
+ANSWER_PREFIX = "Thought: I can answer without using any more tools. I'll use the user's language to answer.\nAnswer:"
+ANSWER_WORDS = ("Die", "Antwort", "steht", "in", "der", "Studien-", "und", "Prüfungsordnung", "des", "Studiengangs.")
+
+# characters per prompt token, roughly as counted by llama3.1
+CHARS_PER_TOKEN = 4
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """
+    POST /api/chat and /api/generate like Ollama, streaming one JSON object per line or answering at once
+    """
+    server: "StubOllamaServer"
+
+    def do_POST(self):
+        if self.path not in ("/api/chat", "/api/generate"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/chat":
+            prompt = "".join(message.get("content") or "" for message in request.get("messages", []))
+        else:
+            prompt = request.get("prompt", "")
+        num_predict = (request.get("options") or {}).get("num_predict")
+        answer_tokens = min(self.server.answer_tokens, num_predict) if num_predict else self.server.answer_tokens
+        stream = request.get("stream", True)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if stream else "application/json")
+        self.end_headers()
+
+        words = [f" {ANSWER_WORDS[position % len(ANSWER_WORDS)]}" for position in range(answer_tokens - 1)]
+        tokens = [ANSWER_PREFIX] + words
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+        with self.server.slot() as queued_seconds:
+            prompt_seconds = prompt_tokens / self.server.prompt_rate
+            time.sleep(prompt_seconds)
+            start = time.perf_counter()
+            for position, token in enumerate(tokens):
+                time.sleep(1 / self.server.token_rate)
+                if stream and position < len(tokens) - 1:
+                    try:
+                        self.write(self.response(request, token, done=False))
+                    except (BrokenPipeError, ConnectionResetError):
+                        # the client closed the stream, Ollama stops generating as well
+                        return
+            eval_seconds = time.perf_counter() - start
+
+        final = self.response(request, tokens[-1] if stream else "".join(tokens), done=True)
+        final.update({
+            "done_reason": "stop",
+            "total_duration": int((queued_seconds + prompt_seconds + eval_seconds) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(eval_seconds * 1e9),
+        })
+        self.write(final)
+
+    def response(self, request: dict, text: str, done: bool) -> dict:
+        response = {"model": request.get("model", ""), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "done": done}
+        if self.path == "/api/chat":
+            response["message"] = {"role": "assistant", "content": text}
+        else:
+            response["response"] = text
+        return response
+
+    def write(self, response: dict):
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Ollama server generating a fixed answer at a configurable speed: prompts are processed at
+    prompt_rate tokens per second, the answer is generated at token_rate tokens per second and at most parallel
+    requests are processed at the same time, further requests wait like with OLLAMA_NUM_PARALLEL.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token_rate: float = 20.0, prompt_rate: float = 200.0,
+                 answer_tokens: int = 80, parallel: int = 1):
+        """
+        :param host:
+        :param port: 0 picks a free port
+        :param token_rate: generated tokens per second of one request
+        :param prompt_rate: prompt tokens processed per second before the first token
+        :param answer_tokens: tokens of each answer
+        :param parallel: requests processed at the same time
+        """
+        super().__init__((host, port), StubOllamaHandler)
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.answer_tokens = answer_tokens
+        self._slots = threading.Semaphore(parallel)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @contextmanager
+    def slot(self):
+        """Wait for a free processing slot, yields the seconds spent waiting"""
+        start = time.perf_counter()
+        with self._slots:
+            yield time.perf_counter() - start
+
+    def start(self) -> threading.Thread:
+        """
+        Serve from a background thread
+        :return: the serving thread
+        """
+        thread = threading.Thread(target=self.serve_forever, name="stub-ollama", daemon=True)
+        thread.start()
+        chatbot_logger.info(f"Stub Ollama server listening on {self.url}")
+        return thread
+
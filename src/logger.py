@@ -1,20 +1,89 @@
+import atexit
+import gzip
+import json
 import logging
 import os
+import queue
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# rotation defaults: 10 MB per file, 10 compressed backups
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 10
 
-def _logger(logger: str, logLevel: int, file: str) -> logging.Logger:
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with the fields passed as extra={"fields": {...}}"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {"message": record.getMessage()}
+        return json.dumps({"timestamp": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"), **fields}, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotates the file when it exceeds a size or after a time interval and compresses the rotated files with gzip
+    (file.1.gz is the newest backup)
+    """
+
+    def __init__(self, filename: str, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT,
+                 interval: float = None):
+        """
+        :param filename:
+        :param max_bytes: rotate when the file would exceed this size, 0 disables size rotation
+        :param backup_count: rotated files kept
+        :param interval: rotate after this many seconds, None disables time rotation
+        """
+        super().__init__(filename, mode='a', maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            # nothing to rotate yet
+            self.rollover_at = time.time() + self.interval
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+def _logger(logger: str, logLevel: int, file: str, log_formatter: logging.Formatter = formatter,
+            interval: float = None) -> logging.Logger:
+    """
+    Attach a rotating file handler to a logger. Records are written by a background thread, so logging never waits
+    for file I/O.
+    """
     if not os.path.exists(os.path.dirname(file)):
         os.makedirs(os.path.dirname(file))
-    handler = logging.FileHandler(
-        filename=file, mode='a', encoding='utf-8')
-    handler.setFormatter(formatter)
+    handler = CompressingRotatingFileHandler(filename=file, interval=interval)
+    handler.setFormatter(log_formatter)
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    # write the remaining records on exit
+    atexit.register(listener.stop)
 
     logger = logging.getLogger(logger)
     logger.setLevel(logLevel)
-    logger.addHandler(handler)
+    logger.addHandler(QueueHandler(records))
     return logger
 
 
@@ -38,3 +107,16 @@ def message_logger(logLevel: int = logging.DEBUG, file: str = "temp/messages.log
     message logging disabled: logLevel = logging.WARNING, logging.ERROR, logging.CRITICAL
     """
     return _logger('Messages', logLevel, file)
+
+
+def query_logger(logLevel: int = logging.INFO, file: str = "temp/queries.jsonl",
+                 interval: float = 24 * 60 * 60) -> logging.Logger:
+    """
+    structured log of every query (course, question, latency, sources, answered), one JSON object per line, rotated
+    daily or by size; read it with log_stats.py
+    :param logLevel: logging.INFO enables, logging.WARNING disables the query log
+    :param file:
+    :param interval: seconds until the file is rotated
+    :return:
+    """
+    return _logger('Queries', logLevel, file, log_formatter=JsonFormatter(), interval=interval)
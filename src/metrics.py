@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+# upper bounds of the latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300)
+# upper bounds of histograms that are no latencies
+ITERATION_BUCKETS = (1, 2, 3, 5, 8, 13)
+TOKEN_RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160)
+
+# values kept per histogram to compute percentiles for the summary log line
+RECENT_VALUES = 1024
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_VALUES)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[position] += 1
+
+    def percentile(self, percent: float) -> float:
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics(object):
+    """
+    Thread-safe counters, gauges and histograms of the query pipeline, rendered in the Prometheus text format
+    """
+
+    def __init__(self, prefix: str = "chatbot"):
+        self.prefix = prefix
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            key = (name, _labels(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = DEFAULT_BUCKETS, **labels):
+        """
+        Add a value to a histogram
+        :param name:
+        :param value:
+        :param buckets: upper bounds of the buckets, fixed by the first value of the histogram
+        :param labels:
+        """
+        with self._lock:
+            key = (name, _labels(labels))
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """
+        Time a stage of the pipeline
+        :param stage: name of the stage
+        :param labels: additional labels
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                for (metric, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        bucket_labels = _format_labels(labels, f'le="{bound}"')
+                        lines.append(f"{self.prefix}_{name}_bucket{bucket_labels} {count}")
+                    bucket_labels = _format_labels(labels, 'le="+Inf"')
+                    lines.append(f"{self.prefix}_{name}_bucket{bucket_labels} {histogram.count}")
+                    lines.append(f"{self.prefix}_{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{self.prefix}_{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line summary: count, mean and p95 of every histogram and all counters"""
+        parts = []
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                if name == "stage_seconds":
+                    label = dict(labels).get("stage", "") + _format_labels(tuple(l for l in labels if l[0] != "stage"))
+                else:
+                    label = name + _format_labels(labels)
+                parts.append(f"{label} n={histogram.count} mean={histogram.sum / histogram.count:.3f} "
+                             f"p95={histogram.percentile(95):.3f}")
+            for (name, labels), value in sorted(self._counters.items()):
+                parts.append(f"{name}{_format_labels(labels)}={value:g}")
+        return " | ".join(parts)
+
+
+# metrics of this process
+metrics = Metrics()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve the metrics at http://host:port/metrics from a background thread
+    :param port:
+    :param host: interface to listen on, only local by default
+    :return: the running server
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    chatbot_logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+def start_metrics_logger(interval: float) -> threading.Thread:
+    """
+    Log the metrics summary periodically from a background thread
+    :param interval: seconds between two summaries
+    :return: the logging thread
+    """
+
+    def log_summary():
+        while True:
+            time.sleep(interval)
+            chatbot_logger.info(f"Metrics: {metrics.summary()}")
+
+    thread = threading.Thread(target=log_summary, name="metrics-logger", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import List
+
+from src.Course import Course
+from src.metrics import metrics
+from src.QueryResult import ERROR_ANSWER, QueryResult
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+class WorkerUnavailable(Exception):
+    pass
+
+
+def _unreachable(error: urllib.error.URLError) -> bool:
+    """Whether a request failed before the worker received it, e.g. because the connection was refused"""
+    return not isinstance(error, urllib.error.HTTPError) and isinstance(error.reason, OSError) and \
+        not isinstance(error.reason, TimeoutError)
+
+
+class Worker(object):
+    """A worker process as seen by the front-end"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        # questions sent and not answered yet
+        self.pending = 0
+
+
+class RemoteChatBot(object):
+    """
+    Forwards the questions to ChatBot worker processes (WorkerServer) instead of answering them in this process.
+    A question goes to the healthy worker with the fewest pending questions; workers that refuse connections are
+    skipped until a health check succeeds again.
+    """
+
+    def __init__(self, urls: List[str], timeout: float = 360.0, health_interval: float = 10.0):
+        """
+        :param urls: base URLs of the workers, e.g. http://127.0.0.1:8101
+        :param timeout: seconds to wait for an answer, or for the next chunk when streaming
+        :param health_interval: seconds between two health checks of the workers
+        """
+        if not urls:
+            raise ValueError("RemoteChatBot requires at least one worker URL")
+        self.workers = [Worker(url) for url in urls]
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def answer(self, query: str, course: Course, mode: str = None) -> QueryResult:
+        """
+        Run chat query on a worker
+        :param query:
+        :param course:
+        :param mode: "agent" or "direct", defaults to the query mode of the worker
+        :return: answer, sources and whether the question could be answered
+        """
+        try:
+            with self.__open("/query", query, course, mode) as response:
+                result = json.load(response)
+        except Exception as e:
+            chatbot_logger.error(f"Query failed on the workers: {e!r}")
+            metrics.inc("worker_errors_total", streaming=False)
+            return QueryResult(answer=ERROR_ANSWER, answered=False, error=repr(e))
+        return QueryResult(answer=result["answer"], sources=result["sources"], answered=result["answered"],
+                           cached=result["cached"], error=result.get("error"))
+
+    def perform_query(self, query: str, course: Course):
+        """
+        Run chat query on a worker
+        :param query:
+        :param course:
+        :return: answer including the sources
+        """
+        return str(self.answer(query, course))
+
+    def stream_query(self, query: str, course: Course, mode: str = None):
+        """
+        Run chat query on a worker and stream the answer while it is generated
+        :param query:
+        :param course:
+        :param mode: "agent" or "direct", defaults to the query mode of the worker
+        :return: generator of text chunks, the sources are the last chunk
+        """
+        started = False
+        try:
+            with self.__open("/stream", query, course, mode) as response:
+                for line in response:
+                    chunk = json.loads(line)
+                    started = True
+                    yield chunk
+        except Exception as e:
+            chatbot_logger.error(f"Streaming query failed on the workers: {e!r}")
+            metrics.inc("worker_errors_total", streaming=True)
+            yield ("\n\n" if started else "") + ERROR_ANSWER
+
+    @contextmanager
+    def __open(self, path: str, query: str, course: Course, mode: str = None):
+        """
+        Send a question to a worker, trying the next one if a worker cannot be reached. Timeouts and connections
+        closed by the worker after the question was sent are not retried, the worker may still be answering or the
+        question itself may make it fail.
+        :return: the response
+        """
+        body = json.dumps({"query": query, "course": course.value, "mode": mode}).encode("utf-8")
+        tried = set()
+        while True:
+            worker = self.__choose(tried)
+            if worker is None:
+                raise WorkerUnavailable(f"No worker reachable, tried {', '.join(w.url for w in tried)}")
+            tried.add(worker)
+            request = urllib.request.Request(worker.url + path, data=body,
+                                             headers={"Content-Type": "application/json"})
+            try:
+                try:
+                    response = urllib.request.urlopen(request, timeout=self.timeout)
+                except urllib.error.URLError as e:
+                    if not _unreachable(e):
+                        raise
+                    self.__set_health(worker, False, e)
+                    metrics.inc("worker_retries_total", worker=worker.url)
+                    continue
+                with response:
+                    yield response
+                return
+            finally:
+                with self._lock:
+                    worker.pending -= 1
+                    metrics.set("worker_in_flight", worker.pending, worker=worker.url)
+
+    def __choose(self, tried: set):
+        """Healthy worker with the fewest pending questions, round robin on ties; unhealthy workers as last resort"""
+        with self._lock:
+            workers = self.workers[self._next:] + self.workers[:self._next]
+            candidates = [worker for worker in workers if worker.healthy and worker not in tried] or \
+                         [worker for worker in workers if worker not in tried]
+            if not candidates:
+                return None
+            worker = min(candidates, key=lambda candidate: candidate.pending)
+            self._next = (self.workers.index(worker) + 1) % len(self.workers)
+            worker.pending += 1
+            metrics.set("worker_in_flight", worker.pending, worker=worker.url)
+            return worker
+
+    def __set_health(self, worker: Worker, healthy: bool, reason=None):
+        if worker.healthy != healthy:
+            if healthy:
+                chatbot_logger.info(f"Worker {worker.url} is available again")
+            else:
+                chatbot_logger.warning(f"Worker {worker.url} is unavailable: {reason!r}")
+        worker.healthy = healthy
+        metrics.set("worker_up", 1 if healthy else 0, worker=worker.url)
+
+    def check_health(self):
+        """Query /health of every worker and mark it available or not"""
+        for worker in self.workers:
+            try:
+                with urllib.request.urlopen(worker.url + "/health", timeout=min(self.timeout, 5.0)) as response:
+                    healthy = json.load(response).get("status") == "ok"
+                self.__set_health(worker, healthy, "status not ok")
+            except Exception as e:
+                self.__set_health(worker, False, e)
+
+    def start_health_checks(self) -> threading.Thread:
+        """
+        Check the health of the workers every health_interval from a background thread
+        :return: the thread
+        """
+
+        def check():
+            while True:
+                self.check_health()
+                if self._stop.wait(self.health_interval):
+                    return
+
+        thread = threading.Thread(target=check, name="worker-health", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
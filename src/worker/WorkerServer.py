@@ -0,0 +1,110 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.ChatBot import QUERY_MODES, ChatBot, Course
+from src.metrics import metrics
+
+chatbot_logger = logging.getLogger('ChatBot')
+
+
+class WorkerRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health, GET /courses, POST /query and POST /stream with a JSON body {"query", "course", "mode"}.
+    /stream answers with one JSON string per line and closes the connection after the last chunk.
+    """
+    server: "WorkerServer"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "pending": self.server.pending,
+                                 "concurrency": self.server.concurrency,
+                                 "loaded": [course.value for course in self.server.chatbot.loaded_courses()]})
+        elif self.path == "/courses":
+            self.send_json(200, {"courses": [course.value for course in Course]})
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/query", "/stream"):
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            query, course, mode = request["query"], Course(request["course"]), request.get("mode")
+            if mode is not None and mode not in QUERY_MODES:
+                raise ValueError(f"Unsupported query mode {mode}, expected one of {QUERY_MODES}")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        if self.path == "/query":
+            with self.server.query_slot():
+                result = self.server.chatbot.answer(query, course, mode)
+            self.send_json(200, {"answer": result.answer, "sources": result.sources, "answered": result.answered,
+                                 "cached": result.cached, "error": result.error})
+        else:
+            self.stream(query, course, mode)
+
+    def stream(self, query: str, course: Course, mode: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+        with self.server.query_slot():
+            chunks = self.server.chatbot.stream_query(query, course, mode)
+            try:
+                for chunk in chunks:
+                    self.wfile.write(json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # the front-end gave up, stop generating
+                chatbot_logger.warning("Front-end closed the connection of a streaming query")
+                chunks.close()
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        chatbot_logger.debug(f"Worker request: {format % args}")
+
+
+class WorkerServer(ThreadingHTTPServer):
+    """
+    Serves the questions forwarded by the Discord front-end (RemoteChatBot) with a ChatBot of this process
+    """
+    daemon_threads = True
+
+    def __init__(self, chatbot: ChatBot, host: str = "127.0.0.1", port: int = 8101, concurrency: int = 1):
+        """
+        :param chatbot:
+        :param host: interface to listen on, only local by default
+        :param port:
+        :param concurrency: questions answered at the same time, further questions wait
+        """
+        super().__init__((host, port), WorkerRequestHandler)
+        self.chatbot = chatbot
+        self.concurrency = concurrency
+        self.pending = 0
+        self._slots = threading.Semaphore(concurrency)
+        self._pending_lock = threading.Lock()
+
+    @contextmanager
+    def query_slot(self):
+        """Wait until fewer than concurrency questions are answered"""
+        with self._pending_lock:
+            self.pending += 1
+            metrics.set("worker_pending", self.pending)
+        try:
+            with self._slots:
+                yield
+        finally:
+            with self._pending_lock:
+                self.pending -= 1
+                metrics.set("worker_pending", self.pending)
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+from llama_index.core.embeddings import MockEmbedding
+
+from src.ChatBot import ChatBot, Course
+from src.helpers.BatchAnswering import completed_ids, run_batch
+from src.helpers.KeepAliveOllama import KeepAliveOllama
+
+SOURCES = {"sources": [{"priority": 1, "name": "FAQ", "file": "FAQ.txt", "description": "Fragen und Antworten",
+                        "web_link": "-"}]}
+FAQ = "Das Semester beginnt am 1. Oktober. Die Vorlesungen beginnen in der zweiten Oktoberwoche."
+
+
+def unused_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class FailingLLMBatchTest(unittest.TestCase):
+    """Questions the LLM fails to answer are recorded as errors and answered again by the next run"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        course_dir = os.path.join(self.directory, "documents", "it")
+        os.makedirs(course_dir)
+        with open(os.path.join(course_dir, "sources.json"), "w", encoding="utf-8") as sources_file:
+            json.dump(SOURCES, sources_file)
+        with open(os.path.join(course_dir, "FAQ.txt"), "w", encoding="utf-8") as faq_file:
+            faq_file.write(FAQ)
+
+        # nothing listens on the port, every LLM call fails
+        llm = KeepAliveOllama(model="llama3.1", base_url=f"http://127.0.0.1:{unused_port()}", request_timeout=5.0)
+        with mock.patch("src.ChatBot.create_embed_model", return_value=MockEmbedding(embed_dim=16)):
+            self.chatbot = ChatBot(documents_dir=os.path.join(self.directory, "documents"),
+                                   index_dir=os.path.join(self.directory, "index"), llm=llm, query_mode="direct",
+                                   min_answer_score=0, answer_cache_size=0, embedding_cache_size=0)
+        self.output = os.path.join(self.directory, "answers.jsonl")
+        self.items = [{"id": "1", "question": "Wann beginnt das Semester?", "course": "it"},
+                      {"id": "2", "question": "Wann beginnen die Vorlesungen?", "course": "it"}]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_failed_questions_are_retried(self):
+        stats = run_batch(self.chatbot, Course, self.items, self.output, parallelism=2)
+        self.assertEqual(2, stats["errors"])
+        self.assertEqual(0, stats["answered"] + stats["unanswered"])
+
+        with open(self.output, encoding="utf-8") as output_file:
+            records = [json.loads(line) for line in output_file]
+        self.assertEqual(["1", "2"], sorted(record["id"] for record in records))
+        self.assertTrue(all("error" in record and "answer" not in record for record in records))
+        self.assertEqual(set(), completed_ids(self.output))
+
+        stats = run_batch(self.chatbot, Course, self.items, self.output)
+        self.assertEqual(2, stats["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import Document
+
+from src.ChatBot import ChatBot, Course
+from src.helpers.IndexVersions import CURRENT_FNAME, current_version
+
+FILES = 10
+
+
+class SharedIndexTest(unittest.TestCase):
+    """A read-only ChatBot loading the index while another one updates it gets complete versions of it"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.documents_dir = os.path.join(self.directory, "documents")
+        self.index_dir = os.path.join(self.directory, "index")
+        os.makedirs(os.path.join(self.documents_dir, "it"))
+        sources = [{"priority": 1, "name": f"Datei {number}", "file": f"{number}.txt", "description": "-",
+                    "web_link": "-"} for number in range(FILES)]
+        with open(os.path.join(self.documents_dir, "it", "sources.json"), "w", encoding="utf-8") as sources_file:
+            json.dump({"sources": sources}, sources_file)
+        for number in range(FILES):
+            self.write(number, f"Absatz {number}. " * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, number: int, text: str):
+        with open(os.path.join(self.documents_dir, "it", f"{number}.txt"), "a", encoding="utf-8") as text_file:
+            text_file.write(text)
+
+    def chatbot(self, read_only_index: bool) -> ChatBot:
+        with mock.patch("src.ChatBot.create_embed_model", return_value=MockEmbedding(embed_dim=16)):
+            return ChatBot(documents_dir=self.documents_dir, index_dir=self.index_dir, llm=MockLLM(),
+                           query_mode="direct", answer_cache_size=0, embedding_cache_size=0,
+                           read_only_index=read_only_index)
+
+    def test_load_while_updating(self):
+        writer = self.chatbot(read_only_index=False)
+        course = Course("it")
+        writer.engine(course)
+        reader = self.chatbot(read_only_index=True)
+
+        errors = []
+        stop = threading.Event()
+
+        def load():
+            while not stop.is_set():
+                try:
+                    reader.refresh_index(course)
+                    index = reader.engine(course).index
+                    index.docstore.get_nodes(index.vector_store.node_ids)
+                except Exception as e:
+                    errors.append(e)
+
+        loader = threading.Thread(target=load)
+        loader.start()
+        try:
+            for update in range(10):
+                self.write(update % FILES, f" Ergänzung {update}.")
+                writer.refresh_index(course)
+        finally:
+            stop.set()
+            loader.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(11, current_version(course.persist_dir()))
+        # the current and the previous version are kept
+        self.assertEqual(["v10", "v11"], sorted(name for name in os.listdir(course.persist_dir())
+                                                if name.startswith("v")))
+
+    def test_migrate_index_without_versions(self):
+        # index persisted directly into the course directory by older versions
+        index = VectorStoreIndex.from_documents([Document(text="Altes Dokument", doc_id="old")],
+                                                embed_model=MockEmbedding(embed_dim=16))
+        index.storage_context.persist(persist_dir=os.path.join(self.index_dir, "it"))
+
+        reader = self.chatbot(read_only_index=True)
+        self.assertEqual({"old"}, set(reader.engine(Course("it")).index.ref_doc_info))
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, "it", CURRENT_FNAME)))
+
+        writer = self.chatbot(read_only_index=False)
+        writer.engine(Course("it"))
+        self.assertEqual(["current.json", "manifest.json", "v1"],
+                         sorted(os.listdir(os.path.join(self.index_dir, "it"))))
+
+
+if __name__ == "__main__":
+    unittest.main()
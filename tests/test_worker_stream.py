@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from llama_index.core.embeddings import MockEmbedding
+
+from src.ChatBot import ChatBot, Course
+from src.helpers.KeepAliveOllama import KeepAliveOllama
+from src.helpers.StubOllama import StubOllamaServer
+from src.metrics import metrics
+from src.worker.WorkerServer import WorkerServer
+
+SOURCES = {"sources": [{"priority": 1, "name": "FAQ", "file": "FAQ.txt", "description": "Fragen und Antworten",
+                        "web_link": "-"}]}
+FAQ = "Das Semester beginnt am 1. Oktober. Die Vorlesungen beginnen in der zweiten Oktoberwoche."
+
+
+class RecordingWorkerServer(WorkerServer):
+    """WorkerServer recording the exceptions of its request handlers instead of printing them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors = []
+
+    def handle_error(self, request, client_address):
+        self.errors.append(sys.exc_info()[1])
+
+
+class StreamCloseTest(unittest.TestCase):
+    """A streamed answer that is closed partway through stops without an error answer"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        course_dir = os.path.join(cls.directory, "documents", "it")
+        os.makedirs(course_dir)
+        with open(os.path.join(course_dir, "sources.json"), "w", encoding="utf-8") as sources_file:
+            json.dump(SOURCES, sources_file)
+        with open(os.path.join(course_dir, "FAQ.txt"), "w", encoding="utf-8") as faq_file:
+            faq_file.write(FAQ)
+
+        # a slow answer, so the stream is still running when it is closed
+        cls.ollama = StubOllamaServer(token_rate=50, prompt_rate=100000, answer_tokens=200)
+        cls.ollama.start()
+        llm = KeepAliveOllama(model="llama3.1", base_url=cls.ollama.url, request_timeout=30.0)
+        with mock.patch("src.ChatBot.create_embed_model", return_value=MockEmbedding(embed_dim=16)):
+            cls.chatbot = ChatBot(documents_dir=os.path.join(cls.directory, "documents"),
+                                  index_dir=os.path.join(cls.directory, "index"), llm=llm, query_mode="direct",
+                                  min_answer_score=0, answer_cache_size=0, embedding_cache_size=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ollama.shutdown()
+        cls.ollama.server_close()
+        shutil.rmtree(cls.directory)
+
+    def errors(self) -> float:
+        return sum(float(line.rsplit(" ", 1)[1]) for line in metrics.render().splitlines()
+                   if line.startswith("chatbot_query_errors_total"))
+
+    def test_close_stream_query(self):
+        errors = self.errors()
+        chunks = self.chatbot.stream_query("Wann beginnt das Semester?", Course("it"))
+        self.assertTrue(next(chunks))
+        chunks.close()
+        self.assertEqual(errors, self.errors())
+
+    def test_worker_client_disconnects(self):
+        server = RecordingWorkerServer(self.chatbot, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            errors = self.errors()
+            body = json.dumps({"query": "Wann beginnt das Semester?", "course": "it"}).encode("utf-8")
+            with socket.create_connection(server.server_address[:2], timeout=30) as client:
+                client.sendall(b"POST /stream HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+                with client.makefile("rb") as response:
+                    self.assertIn(b" 200 ", response.readline())
+                    while response.readline().strip():
+                        # headers
+                        pass
+                    self.assertTrue(json.loads(response.readline()))
+                client.shutdown(socket.SHUT_RDWR)
+
+            deadline = time.monotonic() + 30
+            while server.pending and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(0, server.pending)
+            self.assertEqual([], server.errors)
+            self.assertEqual(errors, self.errors())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()